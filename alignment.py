@@ -0,0 +1,209 @@
+"""
+Resampling of series with unrelated cadences (FGM, ESA moments, OMNI, MEC) onto a shared time grid.
+
+Epochs are int64 nanoseconds (datetime64 arrays are viewed as such) and every method locates the samples with
+`np.searchsorted`, so aligning n samples onto m grid points costs O(m log n) with no Python loop:
+
+- 'linear': linear interpolation between the two neighbouring samples
+- 'nearest': value of the closest sample
+- 'boxcar': mean of the samples falling in each grid cell [t - dt/2, t + dt/2), for downsampling fast data
+
+Grid points outside the data, or further than `max_gap` from usable samples, are NaN. When the input epochs
+already are the target grid the values are returned as they are, without a copy.
+
+For streaming, `iter_aligned_chunks` aligns one chunk of the target grid at a time using only the (viewed, not
+copied) slice of the source it needs, so every chunk is independent of the others.
+"""
+from datetime import datetime
+
+import numpy as np
+
+
+def as_epoch(epoch):
+    """Return epochs as an int64 nanosecond array, without copying when they already are."""
+    epoch = np.asarray(epoch)
+    if np.issubdtype(epoch.dtype, np.datetime64):
+        return epoch.astype('datetime64[ns]').view(np.int64)
+    return epoch.astype(np.int64, copy=False)
+
+
+def to_ns(value):
+    """Convert an ISO string, datetime, datetime64 or int (already ns) into int64 nanoseconds."""
+    if value is None or isinstance(value, (int, np.integer)):
+        return value
+    if isinstance(value, datetime):
+        value = value.replace(tzinfo=None)
+    return int(np.datetime64(value, 'ns').astype(np.int64))
+
+
+def tt2000_to_ns(tt2000):
+    """Convert sorted CDF TT2000 epochs into int64 Unix nanoseconds (UTC).
+
+    The offset between the two scales only changes at leap seconds, so it is taken from the first and last records
+    and applied with one addition; only a series spanning a leap second is converted record by record.
+    """
+    from spacepy import pycdf
+
+    tt2000 = np.asarray(tt2000, dtype=np.int64)
+    if tt2000.size == 0:
+        return tt2000.copy()
+
+    def offset(value):
+        # A microsecond-aligned probe goes through datetime exactly
+        probe = int(value) - int(value) % 1000
+        return int(np.datetime64(pycdf.lib.tt2000_to_datetime(probe), 'ns').astype(np.int64)) - probe
+
+    first = offset(tt2000[0])
+    if first == offset(tt2000[-1]):
+        return tt2000 + first
+    return np.array(pycdf.lib.v_tt2000_to_datetime(tt2000), dtype='datetime64[ns]').view(np.int64)
+
+
+# Seconds from 0000-01-01 (the origin of CDF_EPOCH and CDF_EPOCH16) to the Unix epoch
+CDF_EPOCH_UNIX_SECONDS = 62167219200
+
+
+def read_cdf_epoch(cdf_file, name):
+    """Read an epoch variable of an open pycdf.CDF as int64 Unix nanoseconds.
+
+    CDF_TIME_TT2000 goes through tt2000_to_ns; CDF_EPOCH (ms) and CDF_EPOCH16 (s, ps) count from year 0 without
+    leap seconds, so they are shifted to the Unix epoch in integer arithmetic.
+    """
+    from spacepy import pycdf
+
+    epoch_type = cdf_file[name].type()
+    raw = cdf_file.raw_var(name)[...]
+    if epoch_type == pycdf.const.CDF_TIME_TT2000.value:
+        return tt2000_to_ns(raw)
+    if epoch_type == pycdf.const.CDF_EPOCH.value:
+        milliseconds = np.floor(raw)
+        return ((milliseconds.astype(np.int64) - CDF_EPOCH_UNIX_SECONDS * 1000) * 10 ** 6 +
+                np.round((raw - milliseconds) * 1e6).astype(np.int64))
+    if epoch_type == pycdf.const.CDF_EPOCH16.value:
+        raw = raw.reshape(-1, 2)
+        return ((raw[:, 0].astype(np.int64) - CDF_EPOCH_UNIX_SECONDS) * 10 ** 9 +
+                (raw[:, 1] // 1000).astype(np.int64))
+    raise ValueError(f"{name} is not an epoch variable (CDF type {epoch_type})")
+
+
+def time_grid(start, stop, cadence):
+    """Regular grid from start (included) to stop (excluded); times in ns, or datetime64 / ISO strings."""
+    return np.arange(to_ns(start), to_ns(stop), int(cadence), dtype=np.int64)
+
+
+def _same_grid(epoch, target):
+    return epoch is target or (epoch.shape == target.shape and np.array_equal(epoch, target))
+
+
+def _linear(epoch, values, target, max_gap):
+    outside = (target < epoch[0]) | (target > epoch[-1])
+    right = np.clip(np.searchsorted(epoch, target, side='left'), 1, len(epoch) - 1)
+    left = right - 1
+
+    t_left = epoch[left]
+    t_right = epoch[right]
+    span = (t_right - t_left).astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = np.where(span > 0, (target - t_left) / span, 0.0)
+    weight = weight.reshape((-1,) + (1,) * (values.ndim - 1))
+
+    result = values[left] + weight * (values[right] - values[left])
+    result[outside] = np.nan
+    if max_gap is not None:
+        result[span > max_gap] = np.nan
+    return result
+
+
+def _nearest(epoch, values, target, max_gap):
+    right = np.clip(np.searchsorted(epoch, target), 1, len(epoch) - 1)
+    left = right - 1
+    choose_right = np.abs(epoch[right] - target) < np.abs(target - epoch[left])
+    index = np.where(choose_right, right, left)
+    result = values[index].astype(float)
+    if max_gap is None:
+        result[(target < epoch[0]) | (target > epoch[-1])] = np.nan
+    else:
+        result[np.abs(epoch[index] - target) > max_gap] = np.nan
+    return result
+
+
+def _boxcar(epoch, values, target, width):
+    """Mean of the samples in [t - width/2, t + width/2) for every target time, NaN-aware, with cumulative sums."""
+    half = width // 2
+    start = np.searchsorted(epoch, target - half, side='left')
+    stop = np.searchsorted(epoch, target - half + width, side='left')
+
+    valid = np.isfinite(values)
+    sums = np.zeros((len(epoch) + 1,) + values.shape[1:])
+    np.cumsum(np.where(valid, values, 0.0), axis=0, out=sums[1:])
+    counts = np.zeros((len(epoch) + 1,) + values.shape[1:])
+    np.cumsum(valid, axis=0, out=counts[1:])
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (sums[stop] - sums[start]) / (counts[stop] - counts[start])
+
+
+def align(epoch, values, target, method='linear', max_gap=None, width=None):
+    """Resample values (first axis along epoch) onto the target epochs.
+
+    max_gap: in ns, grid points further than this from the samples they are computed from are NaN
+    width: boxcar cell width in ns, by default the median spacing of the target grid
+    """
+    epoch = as_epoch(epoch)
+    target = as_epoch(target)
+    values = np.asarray(values)
+
+    if _same_grid(epoch, target):
+        return values
+    if len(epoch) == 0:
+        return np.full((len(target),) + values.shape[1:], np.nan)
+
+    if method == 'linear':
+        if len(epoch) == 1:
+            return _nearest(np.repeat(epoch, 2), np.repeat(values, 2, axis=0), target, max_gap or 0)
+        return _linear(epoch, values.astype(float, copy=False), target, max_gap)
+    if method == 'nearest':
+        if len(epoch) == 1:
+            epoch, values = np.repeat(epoch, 2), np.repeat(values, 2, axis=0)
+        return _nearest(epoch, values, target, max_gap)
+    if method == 'boxcar':
+        if width is None:
+            steps = np.diff(target)
+            width = int(np.median(steps)) if steps.size else 1
+        return _boxcar(epoch, values.astype(float, copy=False), target, int(width))
+    raise ValueError(f"Unknown alignment method: {method}")
+
+
+def align_many(series, target, method='linear', max_gap=None):
+    """Align several series onto one grid.
+
+    series maps a name to an (epoch, values) pair; method and max_gap are either one value for all of them or a
+    dict by name. Returns a dict name -> aligned values.
+    """
+    aligned = {}
+    for name, (epoch, values) in series.items():
+        series_method = method.get(name, 'linear') if isinstance(method, dict) else method
+        series_gap = max_gap.get(name) if isinstance(max_gap, dict) else max_gap
+        aligned[name] = align(epoch, values, target, series_method, series_gap)
+    return aligned
+
+
+def iter_aligned_chunks(epoch, values, target, chunk_size=1_000_000, method='linear', max_gap=None, width=None):
+    """Yield (target_chunk, aligned_chunk) pairs, aligning one chunk of the target grid at a time.
+
+    Only the slice of the source that covers the chunk (plus one neighbour on each side, or the boxcar half width)
+    is used, as a view, so memory stays proportional to the chunk.
+    """
+    epoch = as_epoch(epoch)
+    target = as_epoch(target)
+    values = np.asarray(values)
+    if method == 'boxcar' and width is None:
+        steps = np.diff(target)
+        width = int(np.median(steps)) if steps.size else 1
+    margin = int(width or 0)
+
+    for first in range(0, len(target), chunk_size):
+        target_chunk = target[first:first + chunk_size]
+        start = max(np.searchsorted(epoch, target_chunk[0] - margin, side='left') - 1, 0)
+        stop = min(np.searchsorted(epoch, target_chunk[-1] + margin, side='right') + 1, len(epoch))
+        yield target_chunk, align(epoch[start:stop], values[start:stop], target_chunk, method, max_gap, width)
@@ -0,0 +1,174 @@
+"""
+Batch rendering of line plots (survey panels, event panels, one figure per variable) in a process pool.
+
+Every worker switches matplotlib to the non-interactive Agg backend and keeps one figure template that is reused
+for all of its jobs: the lines are updated in place instead of building a new figure, so memory stays flat however
+many panels are drawn. The template is a bare Agg Figure that pyplot never tracks, so rendering in the calling
+process (max_workers=1) leaves the GUI backend alone and nothing needs closing. Data are reduced with min-max
+decimation to about two points per horizontal pixel before drawing, which keeps every spike visible while drawing a
+few thousand points instead of millions.
+
+A job is a dict with:
+    filename: output path (the extension picks the format)
+    epoch: int64 ns times
+    values: (n,) or (n, k) array
+    labels, title, ylabel: optional text
+    shade: optional (start_ns, stop_ns) span to highlight, e.g. the event window
+
+    render_batch(jobs, max_workers=4)
+    render_intervals(epoch, b, events, 'plots/events', margin=600.0)
+"""
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from tracing import span
+
+FIGURE_SIZE = (10, 4)
+DPI = 100
+
+# Per-worker figure template, created on the first job
+_template = None
+
+
+def decimate_minmax(x, y, n_buckets):
+    """Keep the first, the minimum and the maximum sample of each of n_buckets equal-count buckets.
+
+    x has shape (n,), y (n,) or (n, k); the result keeps the time order of the samples. Series shorter than
+    3 * n_buckets are returned unchanged.
+    """
+    y = np.asarray(y)
+    n = len(x)
+    if n <= 3 * n_buckets:
+        return x, y
+    size = n // n_buckets
+    usable = size * n_buckets
+    column = y.reshape(n, -1)
+
+    # The extremes of every column are kept, and all columns share the union of the picked samples
+    offsets = np.arange(n_buckets) * size
+    picks = [offsets, np.arange(usable, n)]
+    for i in range(column.shape[1]):
+        buckets = np.nan_to_num(column[:usable, i], nan=0.0).reshape(n_buckets, size)
+        picks += [offsets + buckets.argmin(axis=1), offsets + buckets.argmax(axis=1)]
+    picks = np.unique(np.concatenate(picks))
+    return x[picks], y[picks]
+
+
+class _FigureTemplate:
+    def __init__(self):
+        from matplotlib.figure import Figure
+
+        self.figure = Figure(figsize=FIGURE_SIZE, dpi=DPI)
+        self.axis = self.figure.add_subplot()
+        self.axis.xaxis_date()
+        self.axis.grid(True)
+        self.lines = []
+        self.shade = None
+
+    def draw(self, job):
+        import matplotlib.dates as mdates
+
+        epoch = np.asarray(job['epoch'], dtype=np.int64)
+        values = np.asarray(job['values'], dtype=float)
+        values = values.reshape(len(epoch), -1)
+        n_columns = values.shape[1]
+
+        width_px = int(FIGURE_SIZE[0] * DPI)
+        x, values = decimate_minmax(epoch, values, 2 * width_px)
+        x = mdates.date2num(x.astype('datetime64[ns]'))
+
+        # Reuse the existing lines, add the missing ones and hide the spare ones
+        while len(self.lines) < n_columns:
+            self.lines.append(self.axis.plot([], [])[0])
+        labels = job.get('labels') or [None] * n_columns
+        for i, line in enumerate(self.lines):
+            visible = i < n_columns
+            line.set_visible(visible)
+            if visible:
+                line.set_data(x, values[:, i])
+                line.set_label(labels[i] if i < len(labels) and labels[i] else f'_column{i}')
+
+        if self.shade is not None:
+            self.shade.remove()
+            self.shade = None
+        if job.get('shade') is not None:
+            start, stop = mdates.date2num(np.asarray(job['shade'], dtype='datetime64[ns]'))
+            self.shade = self.axis.axvspan(start, stop, color='tab:orange', alpha=0.2)
+
+        self.axis.relim(visible_only=True)
+        self.axis.autoscale_view()
+        self.axis.set_title(job.get('title', ''))
+        self.axis.set_ylabel(job.get('ylabel', ''))
+        legend = self.axis.get_legend()
+        if legend is not None:
+            legend.remove()
+        if any(labels):
+            self.axis.legend(loc='upper right')
+
+        directory = os.path.dirname(job['filename'])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.figure.savefig(job['filename'])
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def _render(job):
+    global _template
+    if _template is None:
+        _template = _FigureTemplate()
+    try:
+        _template.draw(job)
+        return job['filename']
+    except Exception as e:
+        logging.error(f"Rendering {job.get('filename')} failed: {e}")
+        # Start from a clean template after a failure
+        _template = None
+        return None
+
+
+def render_batch(jobs, max_workers=None, chunksize=4):
+    """Render all jobs in a process pool and return the written file names (None for failed jobs)."""
+    jobs = list(jobs)
+    with span('render.batch', 'render', jobs=len(jobs)):
+        if max_workers == 1:
+            return [_render(job) for job in jobs]
+        # Spawned rather than forked: the GUI process runs Qt threads, which a fork would copy in a broken state
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            return list(executor.map(_render, jobs, chunksize=chunksize))
+
+
+def render_intervals(epoch, values, intervals, directory, margin=0.0, labels=None, ylabel='', prefix='event',
+                     max_workers=None, fmt='png'):
+    """Render one panel per interval (dicts with 'start' and 'stop' in ns, like the events catalogue).
+
+    Each panel shows the interval plus `margin` seconds on either side with the interval shaded. Only the slice of
+    the series each panel needs is sent to the workers.
+    """
+    epoch = np.asarray(epoch, dtype=np.int64)
+    margin_ns = int(margin * 1e9)
+    jobs = []
+    for number, interval in enumerate(intervals, start=1):
+        first = np.searchsorted(epoch, interval['start'] - margin_ns, side='left')
+        last = np.searchsorted(epoch, interval['stop'] + margin_ns, side='right')
+        if last <= first:
+            continue
+        rank = interval.get('rank', number)
+        jobs.append({
+            'filename': os.path.join(directory, f'{prefix}_{rank:04d}.{fmt}'),
+            'epoch': epoch[first:last],
+            'values': np.asarray(values)[first:last],
+            'labels': labels,
+            'ylabel': ylabel,
+            'title': f"{prefix} {rank}: {np.datetime64(int(interval['start']), 'ns')}",
+            'shade': (interval['start'], interval['stop']),
+        })
+    return render_batch(jobs, max_workers)
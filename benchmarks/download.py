@@ -0,0 +1,95 @@
+"""
+Offline download benchmark.
+
+Serves a set of synthetic files from a LocalFileServer (with an added per-request latency standing in for a remote
+archive) and downloads them with DownloadService at several concurrency levels, next to a sequential urllib
+baseline that opens a new connection per file like the per-file requests made by pyspedas.
+
+Usage:
+    python benchmarks/download.py                            # 32 files of 4 MB, 20 ms latency
+    python benchmarks/download.py --files 100 --size 1e6 --latency 0.05 --concurrency 1 8 16
+    python benchmarks/download.py --fail-after 1e6           # cut every first transfer to time the resumes
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from download_service import DownloadJob, DownloadService, LocalFileServer  # noqa: E402
+
+
+def write_files(directory, count, size):
+    """Write `count` random files of `size` bytes and return their names and sha256 checksums."""
+    checksums = {}
+    for number in range(count):
+        name = f'file_{number:04d}.bin'
+        data = os.urandom(size)
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(data)
+        checksums[name] = 'sha256:' + hashlib.sha256(data).hexdigest()
+    return checksums
+
+
+def run_urllib(server, names, destination):
+    start = time.perf_counter()
+    total = 0
+    for name in names:
+        with urllib.request.urlopen(server.url(name)) as response, \
+                open(os.path.join(destination, name), 'wb') as f:
+            total += f.write(response.read())
+    return total, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=32, help='number of files')
+    parser.add_argument('--size', type=float, default=4e6, help='bytes per file')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added by the server per request')
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 8], help='levels to compare')
+    parser.add_argument('--fail-after', type=float, default=None,
+                        help='cut the first transfer of every file after this many bytes')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='alis_download_')
+    try:
+        source = os.path.join(root, 'source')
+        os.makedirs(source)
+        checksums = write_files(source, args.files, int(args.size))
+        names = sorted(checksums)
+
+        fail_after = int(args.fail_after) if args.fail_after else None
+        with LocalFileServer(source, latency=args.latency) as server:
+            baseline_dir = os.path.join(root, 'urllib')
+            os.makedirs(baseline_dir)
+            total, seconds = run_urllib(server, names, baseline_dir)
+            print(f"{'urllib sequential':<22} {seconds:8.2f} s {total / seconds / 1e6:8.1f} MB/s")
+
+        for concurrency in args.concurrency:
+            # A fresh server per level so every level sees the same injected failures
+            with LocalFileServer(source, latency=args.latency, fail_after_bytes=fail_after) as server:
+                destination = os.path.join(root, f'service_{concurrency}')
+                jobs = [DownloadJob(server.url(name), os.path.join(destination, name), checksums[name])
+                        for name in names]
+                service = DownloadService(max_concurrency=concurrency, max_connections_per_host=concurrency,
+                                          backoff=0.0)
+                service.download(jobs)
+                summary = service.metrics.summary()
+                print(f"{f'service x{concurrency}':<22} {summary['seconds']:8.2f} s "
+                      f"{summary['throughput_mb_s']:8.1f} MB/s  "
+                      f"ttfb p50 {summary['latency_p50'] * 1e3:6.1f} ms p95 {summary['latency_p95'] * 1e3:6.1f} ms  "
+                      f"{summary['connections_opened']} connections, {summary['connections_reused']} reused, "
+                      f"{summary['attempts']} attempts, {summary['failed']} failed")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
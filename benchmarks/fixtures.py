@@ -0,0 +1,128 @@
+"""
+Synthetic MMS-like CDF fixtures for the benchmarks.
+
+The files mimic the layout of the real MMS products the code reads (FGM survey magnetic field and MEC ephemeris),
+so the benchmarks exercise the same loading paths without any network access. Records are written in blocks so
+that even the 1e8-sample files are generated with bounded memory.
+"""
+import os
+from datetime import datetime
+
+import numpy as np
+
+FGM_VARIABLE = 'mms1_fgm_b_bcs_srvy_l2'
+MEC_VARIABLE = 'mms1_mec_r_gse'
+FGM_CADENCE_NS = 62_500_000  # 16 Hz survey rate
+MEC_CADENCE_NS = 30_000_000_000  # 30 s ephemeris
+EARTH_RADIUS_KM = 6371.0
+START_TIME = datetime(2024, 2, 22)
+BLOCK_SIZE = 1_000_000
+
+
+def fgm_path(directory, n_samples):
+    return os.path.join(directory, f"mms1_fgm_srvy_l2_synthetic_{int(n_samples)}.cdf")
+
+
+def mec_path(directory, n_samples):
+    return os.path.join(directory, f"mms1_mec_srvy_l2_epht89q_synthetic_{int(n_samples)}.cdf")
+
+
+def _new_cdf(path):
+    from spacepy import pycdf
+
+    if os.path.exists(path):
+        os.remove(path)
+    cdf_file = pycdf.CDF(path, '')
+    cdf_file.col_major(False)
+    return cdf_file
+
+
+def _add_epoch(cdf_file, n_samples, cadence_ns):
+    """Create the TT2000 Epoch variable and fill it block by block."""
+    from spacepy import pycdf
+
+    start = pycdf.lib.datetime_to_tt2000(START_TIME)
+    epoch = cdf_file.new('Epoch', type=pycdf.const.CDF_TIME_TT2000, recVary=True)
+    for first in range(0, n_samples, BLOCK_SIZE):
+        count = min(BLOCK_SIZE, n_samples - first)
+        epoch.extend(start + (first + np.arange(count, dtype=np.int64)) * cadence_ns)
+
+
+def write_fgm(path, n_samples, seed=0):
+    """Write an FGM-like file: B in BCS plus its magnitude, with a turbulent-looking random walk on top of a
+    slowly rotating background field."""
+    from spacepy import pycdf
+
+    n_samples = int(n_samples)
+    rng = np.random.default_rng(seed)
+    with _new_cdf(path) as cdf_file:
+        _add_epoch(cdf_file, n_samples, FGM_CADENCE_NS)
+
+        cdf_file.new('label_b_bcs_srvy', data=np.array(['Bx        ', 'By        ', 'Bz        ', 'Bt        ']),
+                     type=pycdf.const.CDF_CHAR, recVary=False)
+        b_var = cdf_file.new(FGM_VARIABLE, type=pycdf.const.CDF_REAL4, dims=[4], recVary=True)
+        b_var.attrs['DEPEND_0'] = 'Epoch'
+        b_var.attrs['LABL_PTR_1'] = 'label_b_bcs_srvy'
+        b_var.attrs['UNITS'] = 'nT'
+        b_var.attrs['FILLVAL'] = np.float32(-1e31)
+
+        walk = np.zeros(3)
+        for first in range(0, n_samples, BLOCK_SIZE):
+            count = min(BLOCK_SIZE, n_samples - first)
+            phase = 2 * np.pi * (first + np.arange(count)) / max(n_samples, 1)
+            steps = rng.normal(scale=0.05, size=(count, 3))
+            fluctuation = walk + np.cumsum(steps, axis=0)
+            walk = fluctuation[-1]
+
+            block = np.empty((count, 4), dtype=np.float32)
+            block[:, 0] = 20 * np.cos(phase) + fluctuation[:, 0]
+            block[:, 1] = 20 * np.sin(phase) + fluctuation[:, 1]
+            block[:, 2] = 5 + fluctuation[:, 2]
+            block[:, 3] = np.sqrt(np.sum(block[:, :3] ** 2, axis=1))
+            b_var.extend(block)
+    return path
+
+
+def write_mec(path, n_samples):
+    """Write a MEC-like file with an elliptical orbit (perigee 1.2 Re, apogee 25 Re) in GSE km."""
+    from spacepy import pycdf
+
+    n_samples = int(n_samples)
+    perigee, apogee = 1.2 * EARTH_RADIUS_KM, 25 * EARTH_RADIUS_KM
+    semi_major = (perigee + apogee) / 2
+    eccentricity = (apogee - perigee) / (apogee + perigee)
+    # A few orbits over the file, independent of its length
+    n_orbits = 3
+
+    with _new_cdf(path) as cdf_file:
+        _add_epoch(cdf_file, n_samples, MEC_CADENCE_NS)
+
+        r_var = cdf_file.new(MEC_VARIABLE, type=pycdf.const.CDF_DOUBLE, dims=[3], recVary=True)
+        r_var.attrs['DEPEND_0'] = 'Epoch'
+        r_var.attrs['UNITS'] = 'km'
+
+        for first in range(0, n_samples, BLOCK_SIZE):
+            count = min(BLOCK_SIZE, n_samples - first)
+            anomaly = 2 * np.pi * n_orbits * (first + np.arange(count)) / max(n_samples, 1)
+            radius = semi_major * (1 - eccentricity ** 2) / (1 + eccentricity * np.cos(anomaly))
+            block = np.empty((count, 3))
+            block[:, 0] = radius * np.cos(anomaly)
+            block[:, 1] = radius * np.sin(anomaly) * np.cos(0.3)
+            block[:, 2] = radius * np.sin(anomaly) * np.sin(0.3)
+            r_var.extend(block)
+    return path
+
+
+def ensure_fixtures(directory, sizes):
+    """Generate the FGM and MEC fixtures for every size that is not already on disk."""
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for n_samples in sizes:
+        fgm = fgm_path(directory, n_samples)
+        mec = mec_path(directory, n_samples)
+        if not os.path.exists(fgm):
+            write_fgm(fgm, n_samples)
+        if not os.path.exists(mec):
+            write_mec(mec, n_samples)
+        paths[int(n_samples)] = {'fgm': fgm, 'mec': mec}
+    return paths
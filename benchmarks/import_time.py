@@ -0,0 +1,86 @@
+"""
+Cold-start import benchmark.
+
+Every module is imported in a fresh interpreter so nothing is cached between runs. Besides the wall time,
+the benchmark checks that none of the heavy scientific packages end up in sys.modules after the import,
+since those should only be loaded when the feature that needs them is first used.
+
+Usage:
+    python benchmarks/import_time.py            # compare against the stored baseline
+    python benchmarks/import_time.py --update   # record a new baseline
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'import_time.json')
+
+MODULES = ['gui', 'downloader', 'orbit', 'kinetics', 'power_spectral_analysis']
+HEAVY_MODULES = ['pyspedas', 'pytplot', 'plotly', 'spacepy', 'scipy', 'matplotlib', 'pandas']
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = sorted(name for name in {heavy!r} if name in sys.modules)
+print(json.dumps({{'seconds': elapsed, 'heavy': heavy}}))
+"""
+
+
+def time_import(module, repeat):
+    """Import the module in `repeat` fresh interpreters and return the best time and the heavy modules seen."""
+    best = None
+    heavy = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                                cwd=REPO_DIR, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+        sample = json.loads(result.stdout.strip().splitlines()[-1])
+        best = sample['seconds'] if best is None else min(best, sample['seconds'])
+        heavy = sample['heavy']
+    return best, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters per module (best is kept)')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown')
+    parser.add_argument('--update', action='store_true', help='store the measured times as the new baseline')
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+
+    results = {}
+    failed = False
+    for module in MODULES:
+        seconds, heavy = time_import(module, args.repeat)
+        results[module] = seconds
+        status = 'ok'
+        if heavy:
+            status = f"EAGER IMPORT of {', '.join(heavy)}"
+            failed = True
+        elif module in baseline and seconds > baseline[module] * (1 + args.tolerance):
+            status = f"REGRESSION (baseline {baseline[module] * 1e3:.1f} ms)"
+            failed = True
+        print(f"{module:<26} {seconds * 1e3:8.1f} ms  {status}")
+
+    if args.update:
+        os.makedirs(os.path.dirname(BASELINE_FILE), exist_ok=True)
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {BASELINE_FILE}")
+        return 0
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""
+Offline benchmark suite.
+
+Times and memory-profiles the main analysis paths on synthetic MMS-like CDF files (see fixtures.py) and compares
+the results against stored baselines, flagging anything slower or hungrier than the allowed tolerance.
+
+Usage:
+    python benchmarks/suite.py                               # 1e4, 1e5 and 1e6 samples, compare with baseline
+    python benchmarks/suite.py --sizes 1e4 1e6 1e8           # choose the fixture sizes
+    python benchmarks/suite.py --cases load gradients        # run a subset of the cases
+    python benchmarks/suite.py --update                      # record a new baseline
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import fixtures  # noqa: E402
+
+BASELINE_FILE = os.path.join(BENCH_DIR, 'baselines', 'suite.json')
+DEFAULT_DATA_DIR = os.path.join(BENCH_DIR, 'data')
+
+
+def setup_load(paths):
+    return paths['fgm']
+
+
+def run_load(cdf_file):
+    from kinetics import CDFDataProcessor
+
+    return CDFDataProcessor(cdf_file).get_series()
+
+
+def setup_series(paths):
+    from kinetics import CDFDataProcessor
+
+    return CDFDataProcessor(paths['fgm']).get_series()
+
+
+def run_gradients(series):
+    from kinetics import KineticCheckGradient
+
+    kinetic_check = KineticCheckGradient(series)
+    kinetic_check.compute_gradients()
+    return kinetic_check.get_gradients()
+
+
+def run_psd(series):
+    from power_spectral_analysis import PowerSpectralDensity
+
+    return PowerSpectralDensity(series).compute_psd()
+
+
+def run_to_dataframe(series):
+    return series.to_dataframe()
+
+
+def setup_orbit(paths):
+    from orbit import Orbit3D
+
+    return Orbit3D(cdf_file_path=paths['mec'])
+
+
+def run_magnetopause(orbit):
+    return orbit.compute_magnetopause_boundary()
+
+
+def run_orbit_render(orbit):
+    # Serialising the figure is what plotly does before handing it to the browser
+    return orbit.build_figure().to_json()
+
+
+CASES = {
+    'load': (setup_load, run_load),
+    'gradients': (setup_series, run_gradients),
+    'psd': (setup_series, run_psd),
+    'to_dataframe': (setup_series, run_to_dataframe),
+    'magnetopause': (setup_orbit, run_magnetopause),
+    'orbit_render': (setup_orbit, run_orbit_render),
+}
+
+
+def measure(setup, run, paths, repeat):
+    """Return the best wall time over `repeat` runs and the peak traced memory of one extra run."""
+    state = setup(paths)
+
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run(state)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    # Memory is traced in a separate run so the tracing overhead does not pollute the timings
+    gc.collect()
+    tracemalloc.start()
+    run(state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return best, peak
+
+
+def compare(key, result, baseline, tolerance):
+    """Return a description of every metric that regressed beyond the tolerance."""
+    if key not in baseline:
+        return []
+    problems = []
+    for metric in ('seconds', 'peak_bytes'):
+        reference = baseline[key][metric]
+        if reference > 0 and result[metric] > reference * (1 + tolerance):
+            problems.append(f"{metric} {result[metric] / reference:.2f}x baseline")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', type=float, default=[1e4, 1e5, 1e6], help='samples per fixture')
+    parser.add_argument('--cases', nargs='+', choices=sorted(CASES), default=list(CASES), help='cases to run')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per case (best is kept)')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative regression')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='where the synthetic CDF files are cached')
+    parser.add_argument('--update', action='store_true', help='store the results as the new baseline')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes]
+    all_paths = fixtures.ensure_fixtures(args.data_dir, sizes)
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+
+    results = {}
+    regressions = 0
+    for size in sizes:
+        for case in args.cases:
+            setup, run = CASES[case]
+            seconds, peak = measure(setup, run, all_paths[size], args.repeat)
+            key = f"{case}@{size}"
+            results[key] = {'seconds': seconds, 'peak_bytes': peak}
+
+            problems = compare(key, results[key], baseline, args.tolerance)
+            regressions += bool(problems)
+            status = 'REGRESSION: ' + ', '.join(problems) if problems else 'ok'
+            print(f"{key:<24} {seconds * 1e3:10.1f} ms {peak / 2 ** 20:10.1f} MiB  {status}")
+
+    if args.update:
+        baseline.update(results)
+        os.makedirs(os.path.dirname(BASELINE_FILE), exist_ok=True)
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {BASELINE_FILE}")
+        return 0
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
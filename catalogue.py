@@ -0,0 +1,245 @@
+"""
+Queryable catalogue of local CDF files.
+
+Data directories are scanned once and, for every file, the variables with their shape, type, units, DEPEND_0,
+cadence and epoch coverage are stored in an SQLite database next to the data. Only the CDF headers are read,
+plus the first and last records (and a few more for the cadence) of the epoch variables, never the data arrays.
+Rescanning only re-indexes files whose size or modification time changed, and drops the ones that disappeared.
+
+Queries go to the database alone, so they never open a CDF:
+
+    catalogue = CDFCatalogue('data/catalogue.sqlite')
+    catalogue.scan('data')
+    catalogue.find('mms1_fgm_b_gse_brst_l2', '2024-02-22T00:00', '2024-02-23T00:00')
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import numpy as np
+
+from alignment import to_ns
+from tracing import span
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    start_ns INTEGER,
+    stop_ns INTEGER
+);
+CREATE TABLE IF NOT EXISTS variables (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    shape TEXT NOT NULL,
+    records INTEGER NOT NULL,
+    data_type TEXT,
+    units TEXT,
+    depend_0 TEXT,
+    cadence_ns INTEGER,
+    start_ns INTEGER,
+    stop_ns INTEGER
+);
+CREATE INDEX IF NOT EXISTS variables_name ON variables(name, start_ns, stop_ns);
+CREATE INDEX IF NOT EXISTS variables_file ON variables(file_id);
+CREATE INDEX IF NOT EXISTS files_time ON files(start_ns, stop_ns);
+"""
+
+# Records read at the start of an epoch variable to estimate its cadence
+CADENCE_RECORDS = 64
+
+# Version suffix of the SPDF file names, e.g. mms1_fgm_srvy_l2_20240222_v5.441.0.cdf
+VERSION_PATTERN = re.compile(r'_v(\d+(?:\.\d+)*)\.cdf$', re.IGNORECASE)
+
+
+def latest_versions(paths):
+    """Keep the highest `_vX.Y.Z` of every product and day among the paths, in their original order.
+
+    Files are grouped by their name without the version suffix, whatever their directory; files without a version
+    are all kept.
+    """
+    latest = {}
+    for path in paths:
+        match = VERSION_PATTERN.search(os.path.basename(path))
+        if match:
+            key = os.path.basename(path)[:match.start()].lower()
+            version = tuple(int(part) for part in match.group(1).split('.'))
+            if key not in latest or version > latest[key][0]:
+                latest[key] = (version, path)
+    keep = {path for _, path in latest.values()}
+    return [path for path in paths if path in keep or not VERSION_PATTERN.search(os.path.basename(path))]
+
+
+def _epoch_coverage(variable):
+    """Return (start_ns, stop_ns, cadence_ns) of an epoch variable from its first and last records only."""
+    records = len(variable)
+    if records == 0:
+        return None, None, None
+    head = variable[:min(records, CADENCE_RECORDS)]
+    head_ns = np.array([to_ns(value) for value in np.atleast_1d(head)], dtype=np.int64)
+    start = int(head_ns[0])
+    stop = to_ns(variable[records - 1])
+    steps = np.diff(head_ns)
+    steps = steps[steps > 0]
+    cadence = int(np.median(steps)) if steps.size else None
+    return start, stop, cadence
+
+
+def read_cdf_header(path):
+    """Describe every variable of a CDF file without reading its data arrays."""
+    from spacepy import pycdf
+
+    epoch_types = {pycdf.const.CDF_EPOCH.value, pycdf.const.CDF_EPOCH16.value, pycdf.const.CDF_TIME_TT2000.value}
+    described = {}
+    with pycdf.CDF(path) as cdf_file:
+        coverage = {}
+        for name, variable in cdf_file.items():
+            if variable.type() in epoch_types:
+                coverage[name] = _epoch_coverage(variable)
+
+        for name, variable in cdf_file.items():
+            attrs = variable.attrs
+            depend_0 = attrs['DEPEND_0'] if 'DEPEND_0' in attrs else None
+            # Epoch variables cover themselves, data variables take the coverage of their DEPEND_0
+            start, stop, cadence = coverage.get(name) or coverage.get(depend_0) or (None, None, None)
+            described[name] = {
+                'shape': list(variable.shape),
+                'records': len(variable),
+                'data_type': pycdf.lib.cdftypenames.get(variable.type(), str(variable.type())),
+                'units': str(attrs['UNITS']) if 'UNITS' in attrs else None,
+                'depend_0': str(depend_0) if depend_0 is not None else None,
+                'cadence_ns': cadence,
+                'start_ns': start,
+                'stop_ns': stop,
+            }
+    return described
+
+
+class CDFCatalogue:
+    def __init__(self, database_path):
+        self.database_path = database_path
+        self.connection = sqlite3.connect(database_path)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def _index_file(self, path, stat):
+        described = read_cdf_header(path)
+        starts = [info['start_ns'] for info in described.values() if info['start_ns'] is not None]
+        stops = [info['stop_ns'] for info in described.values() if info['stop_ns'] is not None]
+
+        with self.connection:
+            self.connection.execute('DELETE FROM files WHERE path = ?', (path,))
+            cursor = self.connection.execute(
+                'INSERT INTO files (path, size, mtime_ns, start_ns, stop_ns) VALUES (?, ?, ?, ?, ?)',
+                (path, stat.st_size, stat.st_mtime_ns, min(starts) if starts else None, max(stops) if stops else None))
+            file_id = cursor.lastrowid
+            self.connection.executemany(
+                'INSERT INTO variables (file_id, name, shape, records, data_type, units, depend_0, cadence_ns, '
+                'start_ns, stop_ns) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(file_id, name, json.dumps(info['shape']), info['records'], info['data_type'], info['units'],
+                  info['depend_0'], info['cadence_ns'], info['start_ns'], info['stop_ns'])
+                 for name, info in described.items()])
+
+    def scan(self, *directories, pattern='.cdf'):
+        """Index new and changed CDF files under the directories and forget the deleted ones.
+
+        Returns the number of files (re)indexed.
+        """
+        known = {path: (size, mtime_ns)
+                 for path, size, mtime_ns in self.connection.execute('SELECT path, size, mtime_ns FROM files')}
+        seen = set()
+        indexed = 0
+
+        with span('catalogue.scan', 'decode') as scan_span:
+            for directory in directories:
+                root = os.path.abspath(directory)
+                for dirpath, _, filenames in os.walk(root):
+                    for filename in filenames:
+                        if not filename.lower().endswith(pattern):
+                            continue
+                        path = os.path.join(dirpath, filename)
+                        stat = os.stat(path)
+                        seen.add(path)
+                        if known.get(path) == (stat.st_size, stat.st_mtime_ns):
+                            continue
+                        try:
+                            self._index_file(path, stat)
+                            indexed += 1
+                            scan_span.add_bytes(stat.st_size)
+                        except Exception as e:
+                            logging.error(f"Could not read the header of {path}: {e}")
+
+                # Files under this directory that are gone from disk
+                removed = [(path,) for path in known
+                           if path not in seen and path.startswith(os.path.join(root, ''))]
+                with self.connection:
+                    self.connection.executemany('DELETE FROM files WHERE path = ?', removed)
+
+        logging.info(f"Catalogue: {indexed} files indexed, {len(seen) - indexed} unchanged")
+        return indexed
+
+    def find(self, variable, start=None, stop=None, latest=False):
+        """Return the files holding `variable` with data overlapping [start, stop], in time order.
+
+        latest: only keep the highest version of every product and day (see latest_versions), as pyspedas leaves
+        the superseded ones on disk
+        """
+        query = ('SELECT files.path FROM variables JOIN files ON files.id = variables.file_id '
+                 'WHERE variables.name = ? AND variables.records > 0')
+        parameters = [variable]
+        if start is not None:
+            query += ' AND variables.stop_ns >= ?'
+            parameters.append(to_ns(start))
+        if stop is not None:
+            query += ' AND variables.start_ns <= ?'
+            parameters.append(to_ns(stop))
+        query += ' ORDER BY variables.start_ns'
+        paths = [path for (path,) in self.connection.execute(query, parameters)]
+        return latest_versions(paths) if latest else paths
+
+    def variables(self, path=None, like=None):
+        """List the variable names in one file, or in the whole catalogue, optionally with a SQL LIKE filter."""
+        query = 'SELECT DISTINCT variables.name FROM variables JOIN files ON files.id = variables.file_id WHERE 1'
+        parameters = []
+        if path is not None:
+            query += ' AND files.path = ?'
+            parameters.append(os.path.abspath(path))
+        if like is not None:
+            query += ' AND variables.name LIKE ?'
+            parameters.append(like)
+        return [name for (name,) in self.connection.execute(query + ' ORDER BY variables.name', parameters)]
+
+    def describe(self, variable, path=None):
+        """Return the stored metadata of a variable in every file (or one file) that holds it."""
+        query = ('SELECT files.path, variables.shape, variables.records, variables.data_type, variables.units, '
+                 'variables.depend_0, variables.cadence_ns, variables.start_ns, variables.stop_ns '
+                 'FROM variables JOIN files ON files.id = variables.file_id WHERE variables.name = ?')
+        parameters = [variable]
+        if path is not None:
+            query += ' AND files.path = ?'
+            parameters.append(os.path.abspath(path))
+        keys = ['path', 'shape', 'records', 'data_type', 'units', 'depend_0', 'cadence_ns', 'start_ns', 'stop_ns']
+        rows = []
+        for row in self.connection.execute(query + ' ORDER BY variables.start_ns', parameters):
+            info = dict(zip(keys, row))
+            info['shape'] = json.loads(info['shape'])
+            rows.append(info)
+        return rows
+
+    def coverage(self, variable):
+        """Return the overall (start_ns, stop_ns) of a variable across the catalogue."""
+        return self.connection.execute('SELECT MIN(start_ns), MAX(stop_ns) FROM variables WHERE name = ?',
+                                       (variable,)).fetchone()
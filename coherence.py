@@ -0,0 +1,131 @@
+"""
+Cross-spectral density, coherence and phase between any number of aligned series (e.g. THEMIS FGM against the
+ground magnetometers thg_mag_fsmi / fykn / atha, resampled onto one grid with alignment.py).
+
+All series share one Welch segmentation: the segments are strided views of the input, detrended, windowed and
+transformed with a single batched rfft, and the spectral matrix of every pair is one einsum over the segments.
+Segments where any series has a NaN are dropped for all of them, so every pair is estimated from the same data.
+
+`iter_sliding_spectra` tracks the spectral matrix over time: segment spectra are computed once and the window
+average is updated by adding the segments entering and subtracting those leaving, so stepping the window costs
+one segment's worth of work rather than a new Welch estimate.
+"""
+import numpy as np
+
+
+def _segment_spectra(x, fs, nperseg, noverlap, window):
+    """Return the frequencies, the valid-segment mask and the scaled spectra (n_series, n_segments, n_freq)."""
+    from scipy import signal
+
+    x = np.atleast_2d(np.asarray(x, dtype=float))
+    step = nperseg - noverlap
+    segments = np.lib.stride_tricks.sliding_window_view(x, nperseg, axis=-1)[:, ::step, :]
+    valid = np.all(np.isfinite(segments), axis=(0, 2))
+
+    taper = signal.get_window(window, nperseg)
+    # Remove the mean of each segment and apply the taper in one broadcast, then one FFT for everything
+    spectra = np.fft.rfft((segments - segments.mean(axis=-1, keepdims=True)) * taper, axis=-1)
+    spectra[:, ~valid] = 0
+
+    # Density scaling as in scipy.signal.welch, with the one-sided doubling folded in as sqrt(2) per factor
+    spectra *= np.sqrt(1.0 / (fs * np.sum(taper ** 2)))
+    one_sided = np.ones(spectra.shape[-1])
+    one_sided[1:-1 if nperseg % 2 == 0 else None] = np.sqrt(2)
+    spectra *= one_sided
+
+    return np.fft.rfftfreq(nperseg, 1 / fs), valid, spectra
+
+
+class CrossSpectra:
+    def __init__(self, frequencies, csd, names=None, segments=0):
+        self.frequencies = frequencies
+        # csd[i, j, f] = <conj(X_i) X_j>, the cross-spectral density of every pair
+        self.csd = csd
+        self.names = names if names is not None else [str(i) for i in range(csd.shape[0])]
+        self.segments = segments
+
+    def index(self, name):
+        return self.names.index(name) if not isinstance(name, (int, np.integer)) else name
+
+    def power(self):
+        """Auto-spectral densities, shape (n_series, n_freq)."""
+        return np.real(np.einsum('iif->if', self.csd))
+
+    def coherence(self):
+        """Magnitude-squared coherence of every pair, shape (n_series, n_series, n_freq)."""
+        power = self.power()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.abs(self.csd) ** 2 / (power[:, None, :] * power[None, :, :])
+
+    def phase(self, degrees=True):
+        """Cross phase of every pair; positive when the second series leads the first."""
+        return np.angle(self.csd, deg=degrees)
+
+    def pair(self, first, second):
+        """Return the frequencies, CSD, coherence and phase of one pair, by name or index."""
+        i, j = self.index(first), self.index(second)
+        csd = self.csd[i, j]
+        power = self.power()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            coherence = np.abs(csd) ** 2 / (power[i] * power[j])
+        return self.frequencies, csd, coherence, np.angle(csd, deg=True)
+
+    def band_coherence(self, band):
+        """Coherence matrix averaged over a frequency band (f_low, f_high)."""
+        selected = (self.frequencies >= band[0]) & (self.frequencies <= band[1])
+        return np.nanmean(self.coherence()[:, :, selected], axis=-1)
+
+
+def cross_spectra(x, fs, nperseg=256, noverlap=None, window='hann', names=None):
+    """Welch cross-spectral matrix of the rows of x (n_series, n_samples), all pairs in one batched pass."""
+    noverlap = nperseg // 2 if noverlap is None else noverlap
+    frequencies, valid, spectra = _segment_spectra(x, fs, nperseg, noverlap, window)
+    n_valid = int(valid.sum())
+    csd = np.einsum('isf,jsf->ijf', np.conj(spectra), spectra) / max(n_valid, 1)
+    return CrossSpectra(frequencies, csd, names, n_valid)
+
+
+def iter_sliding_spectra(x, fs, window_segments, step_segments=1, nperseg=256, noverlap=None, window='hann',
+                         names=None, refresh=100):
+    """Yield (centre_index, CrossSpectra) for a window of `window_segments` Welch segments moved by
+    `step_segments` at a time. centre_index is the sample index of the centre of the window.
+
+    The running sum is recomputed from scratch every `refresh` steps so rounding errors cannot accumulate.
+    """
+    noverlap = nperseg // 2 if noverlap is None else noverlap
+    step = nperseg - noverlap
+    frequencies, valid, spectra = _segment_spectra(x, fs, nperseg, noverlap, window)
+    n_segments = spectra.shape[1]
+
+    def block_sum(start, stop):
+        block = spectra[:, start:stop]
+        return np.einsum('isf,jsf->ijf', np.conj(block), block), int(valid[start:stop].sum())
+
+    running, count = None, 0
+    for n_step, start in enumerate(range(0, n_segments - window_segments + 1, step_segments)):
+        stop = start + window_segments
+        if running is None or n_step % refresh == 0 or step_segments >= window_segments:
+            running, count = block_sum(start, stop)
+        else:
+            entering, entering_count = block_sum(stop - step_segments, stop)
+            leaving, leaving_count = block_sum(start - step_segments, start)
+            running += entering - leaving
+            count += entering_count - leaving_count
+
+        centre = start * step + ((window_segments - 1) * step + nperseg) // 2
+        yield centre, CrossSpectra(frequencies, running / max(count, 1), names, count)
+
+
+def sliding_band_coherence(x, fs, band, window_segments, step_segments=1, nperseg=256, noverlap=None,
+                           window='hann', names=None):
+    """Return the window centre indices and the band-averaged coherence matrices (n_windows, n, n)."""
+    centres = []
+    matrices = []
+    for centre, spectra in iter_sliding_spectra(x, fs, window_segments, step_segments, nperseg, noverlap, window,
+                                                names):
+        centres.append(centre)
+        matrices.append(spectra.band_coherence(band))
+    n = np.atleast_2d(x).shape[0]
+    if not matrices:
+        return np.empty(0, dtype=int), np.empty((0, n, n))
+    return np.array(centres), np.stack(matrices)
@@ -0,0 +1,240 @@
+"""
+Time-dependent coordinate transformations (GEI, GEO, GSE, GSM, SM, DSL) and minimum-variance LMN frames.
+
+Rotation matrices follow Hapgood (1992), Planet. Space Sci. 40, 711, with the dipole axis from its secular
+drift formula. For a time grid they are computed once, as an (n, 3, 3) stack, cached, and applied to any number
+of vector series with one batched matrix multiplication.
+
+DSL (despun sun-pointing L-vectorial, used by THEMIS e.g. `tha_peef_velocity_dsl`) needs the spin axis as right
+ascension and declination in GEI, as given by `tha_state_spinras` / `tha_state_spindec`.
+
+    transformer = CoordinateTransformer()
+    v_gse, b_gse = transformer.transform(epoch, [v_dsl, b_dsl], 'dsl', 'gse', spin_axis=(ras, dec))
+    lmn = minimum_variance_frames(epoch, b_gse, window=300.0)
+"""
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+FRAMES = ('gei', 'geo', 'gse', 'gsm', 'sm', 'dsl')
+MJD_UNIX_EPOCH = 40587.0
+NS_PER_DAY = 86400e9
+
+
+def _rotation(angle, axis):
+    """Stack of Hapgood rotation matrices <angle, axis>, angle in radians with shape (n,)."""
+    angle = np.atleast_1d(angle)
+    cos, sin = np.cos(angle), np.sin(angle)
+    zero, one = np.zeros_like(angle), np.ones_like(angle)
+    if axis == 'x':
+        rows = [[one, zero, zero], [zero, cos, sin], [zero, -sin, cos]]
+    elif axis == 'y':
+        rows = [[cos, zero, sin], [zero, one, zero], [-sin, zero, cos]]
+    else:
+        rows = [[cos, sin, zero], [-sin, cos, zero], [zero, zero, one]]
+    return np.moveaxis(np.array(rows), -1, 0)
+
+
+def _transpose(matrices):
+    return np.swapaxes(matrices, -1, -2)
+
+
+def _time_terms(epoch):
+    """Modified Julian date, Julian centuries from J2000 at 0 UT, and UT hours for int64 ns epochs."""
+    mjd = np.asarray(epoch, dtype=np.int64) / NS_PER_DAY + MJD_UNIX_EPOCH
+    mjd_day = np.floor(mjd)
+    t0 = (mjd_day - 51544.5) / 36525.0
+    hours = (mjd - mjd_day) * 24.0
+    return mjd, t0, hours
+
+
+def _sun_longitude_and_obliquity(t0, hours):
+    mean_anomaly = np.radians(357.528 + 35999.050 * t0 + 0.04107 * hours)
+    mean_longitude = 280.460 + 36000.772 * t0 + 0.04107 * hours
+    longitude = np.radians(mean_longitude + (1.915 - 0.0048 * t0) * np.sin(mean_anomaly) +
+                           0.020 * np.sin(2 * mean_anomaly))
+    obliquity = np.radians(23.439 - 0.013 * t0)
+    return longitude, obliquity
+
+
+def gei_to_geo(epoch):
+    mjd, t0, hours = _time_terms(epoch)
+    gmst = np.radians(100.461 + 36000.770 * t0 + 15.04107 * hours)
+    return _rotation(gmst, 'z')
+
+
+def gei_to_gse(epoch):
+    mjd, t0, hours = _time_terms(epoch)
+    longitude, obliquity = _sun_longitude_and_obliquity(t0, hours)
+    return _rotation(longitude, 'z') @ _rotation(obliquity, 'x')
+
+
+def _dipole_in_gse(epoch):
+    """Unit vector of the dipole axis in GSE."""
+    mjd, _, _ = _time_terms(epoch)
+    years = (mjd - 46066.0) / 365.25
+    latitude = np.radians(78.8 + 4.283e-2 * years)
+    longitude = np.radians(289.1 - 1.413e-2 * years)
+    dipole_geo = np.stack([np.cos(latitude) * np.cos(longitude), np.cos(latitude) * np.sin(longitude),
+                           np.sin(latitude)], axis=-1)
+    geo_to_gse = gei_to_gse(epoch) @ _transpose(gei_to_geo(epoch))
+    return np.einsum('nij,nj->ni', geo_to_gse, dipole_geo)
+
+
+def gse_to_gsm(epoch):
+    dipole = _dipole_in_gse(epoch)
+    psi = np.arctan2(dipole[:, 1], dipole[:, 2])
+    return _rotation(-psi, 'x')
+
+
+def gsm_to_sm(epoch):
+    dipole = _dipole_in_gse(epoch)
+    mu = np.arctan(dipole[:, 0] / np.sqrt(dipole[:, 1] ** 2 + dipole[:, 2] ** 2))
+    return _rotation(-mu, 'y')
+
+
+def gei_to_dsl(epoch, spin_ras, spin_dec):
+    """DSL: Z along the spin axis, X towards the Sun projected on the spin plane, Y completing the triad."""
+    mjd, t0, hours = _time_terms(epoch)
+    longitude, obliquity = _sun_longitude_and_obliquity(t0, hours)
+    sun = np.stack([np.cos(longitude), np.cos(obliquity) * np.sin(longitude),
+                    np.sin(obliquity) * np.sin(longitude)], axis=-1)
+
+    ras = np.radians(np.broadcast_to(spin_ras, mjd.shape))
+    dec = np.radians(np.broadcast_to(spin_dec, mjd.shape))
+    z_axis = np.stack([np.cos(dec) * np.cos(ras), np.cos(dec) * np.sin(ras), np.sin(dec)], axis=-1)
+    y_axis = np.cross(z_axis, sun)
+    y_axis /= np.linalg.norm(y_axis, axis=-1, keepdims=True)
+    x_axis = np.cross(y_axis, z_axis)
+    return np.stack([x_axis, y_axis, z_axis], axis=1)
+
+
+def _from_gei(frame, epoch, spin_axis):
+    """Matrices taking GEI vectors into `frame`."""
+    if frame == 'gei':
+        n = len(epoch)
+        return np.broadcast_to(np.eye(3), (n, 3, 3))
+    if frame == 'geo':
+        return gei_to_geo(epoch)
+    if frame == 'dsl':
+        if spin_axis is None:
+            raise ValueError("DSL transformations need the spin axis (right ascension, declination) in GEI")
+        return gei_to_dsl(epoch, *spin_axis)
+    gse = gei_to_gse(epoch)
+    if frame == 'gse':
+        return gse
+    gsm = gse_to_gsm(epoch) @ gse
+    if frame == 'gsm':
+        return gsm
+    if frame == 'sm':
+        return gsm_to_sm(epoch) @ gsm
+    raise ValueError(f"Unknown frame {frame}, expected one of {FRAMES}")
+
+
+def apply(matrices, vectors):
+    """Rotate one (n, 3) series, or several stacked as (n, k, 3), by a stack of (n, 3, 3) matrices."""
+    vectors = np.asarray(vectors, dtype=float)
+    if vectors.ndim == 2:
+        return np.matmul(matrices, vectors[..., None])[..., 0]
+    # (n, k, 3) @ (n, 3, 3)^T rotates the k series of every time at once
+    return np.matmul(vectors, _transpose(matrices))
+
+
+class CoordinateTransformer:
+    def __init__(self, cache_size=32):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    @staticmethod
+    def _grid_key(epoch, spin_axis):
+        digest = hashlib.blake2b(np.ascontiguousarray(epoch).tobytes(), digest_size=16)
+        if spin_axis is not None:
+            for part in spin_axis:
+                digest.update(np.ascontiguousarray(part, dtype=float).tobytes())
+        return digest.hexdigest()
+
+    def matrices(self, epoch, from_frame, to_frame, spin_axis=None):
+        """Return the cached (n, 3, 3) matrices taking from_frame vectors into to_frame at the given epochs."""
+        from_frame, to_frame = from_frame.lower(), to_frame.lower()
+        epoch = np.asarray(epoch, dtype=np.int64)
+        uses_spin = 'dsl' in (from_frame, to_frame)
+        key = (from_frame, to_frame, self._grid_key(epoch, spin_axis if uses_spin else None))
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        if from_frame == to_frame:
+            result = np.broadcast_to(np.eye(3), (len(epoch), 3, 3))
+        else:
+            to_target = _from_gei(to_frame, epoch, spin_axis)
+            if from_frame == 'gei':
+                result = to_target
+            else:
+                # Every path goes through GEI: target <- GEI <- source, the inverse of a rotation being its transpose
+                result = to_target @ _transpose(_from_gei(from_frame, epoch, spin_axis))
+        result = np.ascontiguousarray(result)
+
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    def transform(self, epoch, vectors, from_frame, to_frame, spin_axis=None):
+        """Transform one (n, 3) series, or a list of them sharing the epochs, with one batched multiplication."""
+        matrices = self.matrices(epoch, from_frame, to_frame, spin_axis)
+        if isinstance(vectors, (list, tuple)):
+            stacked = apply(matrices, np.stack([np.asarray(v, dtype=float) for v in vectors], axis=1))
+            return [stacked[:, i] for i in range(len(vectors))]
+        return apply(matrices, vectors)
+
+
+def minimum_variance_frames(epoch, b, window=300.0, step=None):
+    """Minimum variance analysis over sliding windows.
+
+    Returns the window centre epochs, the LMN matrices (rows L, M, N as unit vectors in the frame of b, shape
+    (n_windows, 3, 3)) and the eigenvalues (n_windows, 3) ordered as L, M, N. The moments of all windows come from
+    cumulative sums and the eigen-decompositions are done in one batched call. Signs are kept continuous from one
+    window to the next, and M = N x L so every frame is right-handed.
+    """
+    epoch = np.asarray(epoch, dtype=np.int64)
+    b = np.asarray(b, dtype=float)[:, :3]
+    steps = np.diff(epoch)
+    cadence = np.median(steps[steps > 0]) if np.any(steps > 0) else 1e9
+    width = max(3, int(round(window * 1e9 / cadence)))
+    stride = max(1, int(round(step * 1e9 / cadence))) if step else max(1, width // 2)
+    if len(b) < width:
+        return np.empty(0, dtype=np.int64), np.empty((0, 3, 3)), np.empty((0, 3))
+
+    valid = np.all(np.isfinite(b), axis=1)
+    filled = np.where(valid[:, None], b, 0.0)
+    outer = filled[:, :, None] * filled[:, None, :]
+    sums = np.concatenate([np.zeros((1, 3)), np.cumsum(filled, axis=0)])
+    products = np.concatenate([np.zeros((1, 3, 3)), np.cumsum(outer, axis=0)])
+    counts = np.concatenate([[0], np.cumsum(valid)])
+
+    starts = np.arange(0, len(b) - width + 1, stride)
+    stops = starts + width
+    n = (counts[stops] - counts[starts]).astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (sums[stops] - sums[starts]) / n[:, None]
+        covariance = (products[stops] - products[starts]) / n[:, None, None] - mean[:, :, None] * mean[:, None, :]
+    usable = n >= 3
+    covariance[~usable] = np.eye(3)
+
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    # eigh sorts ascending: N is the minimum variance direction, L the maximum
+    l_axis = eigenvectors[:, :, 2]
+    n_axis = eigenvectors[:, :, 0]
+    for axis in (l_axis, n_axis):
+        flips = np.sign(np.einsum('ij,ij->i', axis[1:], axis[:-1]))
+        flips[flips == 0] = 1
+        axis[1:] *= np.cumprod(flips)[:, None]
+    m_axis = np.cross(n_axis, l_axis)
+
+    frames = np.stack([l_axis, m_axis, n_axis], axis=1)
+    ordered = eigenvalues[:, ::-1].copy()
+    frames[~usable] = np.nan
+    ordered[~usable] = np.nan
+    centres = epoch[starts + width // 2]
+    return centres, frames, ordered
@@ -0,0 +1,578 @@
+"""
+Asynchronous file download service.
+
+Files are fetched over HTTP/1.1 on asyncio streams with keep-alive connections pooled per host, so a batch of
+files from the same server (e.g. one CDF per day from SPDF) reuses a handful of connections instead of opening
+one per file. A semaphore bounds the number of transfers in flight.
+
+Transfers are written to `<destination>.part` and renamed when complete. An interrupted or failed transfer is
+retried with exponential backoff and resumes from the partial file with a Range request. The response's ETag (or
+Last-Modified) is kept next to the partial and sent back as If-Range, and the Content-Range of the reply must start
+at the partial's size, so a partial of an older copy of the file is never completed with bytes of the new one: the
+transfer starts over instead. A partial without a validator is only resumed when a checksum is given. The timeout
+applies to every read, so a connection only fails when it stalls, never because a large file takes long; an overall
+limit per attempt can be set with `deadline`. When a checksum is given the file is verified before it is renamed,
+and the hash is computed while streaming.
+
+Throughput and latency (time to first byte) are recorded for every transfer, see `DownloadService.metrics`.
+
+`LocalFileServer` serves a directory over HTTP (with Range and If-Range support, optional added latency and injected
+failures) so the service can be tested and benchmarked without network access.
+
+    service = DownloadService(max_concurrency=8)
+    results = service.download([DownloadJob(url, 'data/file.cdf', checksum='sha256:...')])
+    print(service.metrics.summary())
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import ssl
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urljoin, urlsplit
+
+from tracing import span
+
+CHUNK_SIZE = 256 * 1024
+MAX_REDIRECTS = 5
+
+
+class DownloadError(Exception):
+    pass
+
+
+class HTTPStatusError(DownloadError):
+    def __init__(self, status, url):
+        super().__init__(f"HTTP {status} for {url}")
+        self.status = status
+
+    @property
+    def retryable(self):
+        # Client errors will not go away by asking again, except timeouts and rate limiting
+        return self.status >= 500 or self.status in (408, 429)
+
+
+class DownloadJob:
+    def __init__(self, url, destination, checksum=None):
+        """checksum: 'algorithm:hexdigest' (e.g. 'sha256:ab12...' or 'md5:...'), or None to skip the check"""
+        self.url = url
+        self.destination = destination
+        self.checksum = checksum
+
+    @property
+    def part_path(self):
+        return self.destination + '.part'
+
+    @property
+    def validator_path(self):
+        return self.destination + '.part.validator'
+
+    def read_validator(self):
+        """The ETag or Last-Modified of the response the partial file comes from, None when unknown."""
+        if not os.path.exists(self.validator_path):
+            return None
+        with open(self.validator_path) as f:
+            return f.read().strip() or None
+
+    def write_validator(self, validator):
+        if validator:
+            with open(self.validator_path, 'w') as f:
+                f.write(validator)
+        elif os.path.exists(self.validator_path):
+            os.remove(self.validator_path)
+
+    def discard_partial(self):
+        for path in (self.part_path, self.validator_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def hasher(self):
+        if not self.checksum:
+            return None
+        algorithm, _, _ = self.checksum.partition(':')
+        return hashlib.new(algorithm)
+
+    def expected_digest(self):
+        return self.checksum.partition(':')[2].lower() if self.checksum else None
+
+
+class TransferMetrics:
+    def __init__(self):
+        self.records = []
+        self.connections_opened = 0
+        self.connections_reused = 0
+        self.started = None
+        self.finished = None
+
+    def record(self, **fields):
+        self.records.append(fields)
+
+    def summary(self):
+        """Totals, throughput and latency percentiles over all transfers."""
+        done = [record for record in self.records if record['ok']]
+        total_bytes = sum(record['bytes'] for record in done)
+        wall = (self.finished or time.perf_counter()) - self.started if self.started else 0.0
+        latencies = sorted(record['ttfb'] for record in done if record['ttfb'] is not None)
+
+        def percentile(fraction):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+        return {
+            'files': len(done),
+            'failed': len(self.records) - len(done),
+            'bytes': total_bytes,
+            'seconds': wall,
+            'throughput_mb_s': total_bytes / wall / 1e6 if wall > 0 else None,
+            'latency_p50': percentile(0.5),
+            'latency_p95': percentile(0.95),
+            'attempts': sum(record['attempts'] for record in self.records),
+            'connections_opened': self.connections_opened,
+            'connections_reused': self.connections_reused,
+        }
+
+
+class _Connection:
+    def __init__(self, reader, writer, key):
+        self.reader = reader
+        self.writer = writer
+        self.key = key
+        self.reused = False
+
+    def close(self):
+        self.writer.close()
+
+
+class ConnectionPool:
+    """Idle keep-alive connections per (scheme, host, port), with a cap on open connections per host."""
+
+    def __init__(self, max_per_host=4, metrics=None, connect_timeout=None):
+        self.max_per_host = max_per_host
+        self.connect_timeout = connect_timeout
+        self.metrics = metrics
+        self._idle = {}
+        self._limits = {}
+        self._ssl_context = None
+
+    def _limit(self, key):
+        if key not in self._limits:
+            self._limits[key] = asyncio.Semaphore(self.max_per_host)
+        return self._limits[key]
+
+    async def acquire(self, scheme, host, port):
+        key = (scheme, host, port)
+        await self._limit(key).acquire()
+        idle = self._idle.get(key, [])
+        while idle:
+            connection = idle.pop()
+            if not connection.reader.at_eof() and not connection.writer.is_closing():
+                connection.reused = True
+                if self.metrics:
+                    self.metrics.connections_reused += 1
+                return connection
+            connection.close()
+        try:
+            ssl_context = None
+            if scheme == 'https':
+                self._ssl_context = self._ssl_context or ssl.create_default_context()
+                ssl_context = self._ssl_context
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port, ssl=ssl_context),
+                                                    self.connect_timeout)
+        except BaseException:
+            self._limit(key).release()
+            raise
+        if self.metrics:
+            self.metrics.connections_opened += 1
+        return _Connection(reader, writer, key)
+
+    def release(self, connection, reusable):
+        if reusable:
+            self._idle.setdefault(connection.key, []).append(connection)
+        else:
+            connection.close()
+        self._limit(connection.key).release()
+
+    def close(self):
+        for idle in self._idle.values():
+            for connection in idle:
+                connection.close()
+        self._idle = {}
+
+
+def _describe(error):
+    # Timeouts and some connection errors have an empty message
+    return f"{type(error).__name__}: {error}" if str(error) else type(error).__name__
+
+
+async def _read_headers(reader, timeout):
+    status_line = (await asyncio.wait_for(reader.readline(), timeout)).decode('latin-1').strip()
+    if not status_line:
+        raise ConnectionError("Connection closed before the response")
+    parts = status_line.split(' ', 2)
+    status = int(parts[1])
+    headers = {}
+    while True:
+        line = (await asyncio.wait_for(reader.readline(), timeout)).decode('latin-1')
+        if line in ('\r\n', '\n', ''):
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return status, headers
+
+
+async def _iter_body(reader, headers, timeout):
+    """Yield the body in chunks, whatever the framing (Content-Length, chunked, or until close).
+
+    Every read waits at most `timeout` seconds, so a stalled connection fails however long the transfer is.
+    """
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await asyncio.wait_for(reader.readline(), timeout)).split(b';')[0].strip(), 16)
+            if size == 0:
+                await asyncio.wait_for(reader.readline(), timeout)
+                return
+            remaining = size
+            while remaining:
+                chunk = await asyncio.wait_for(reader.read(min(CHUNK_SIZE, remaining)), timeout)
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b'', remaining)
+                remaining -= len(chunk)
+                yield chunk
+            await asyncio.wait_for(reader.readline(), timeout)
+    elif 'content-length' in headers:
+        remaining = int(headers['content-length'])
+        while remaining:
+            chunk = await asyncio.wait_for(reader.read(min(CHUNK_SIZE, remaining)), timeout)
+            if not chunk:
+                raise asyncio.IncompleteReadError(b'', remaining)
+            remaining -= len(chunk)
+            yield chunk
+    else:
+        while True:
+            chunk = await asyncio.wait_for(reader.read(CHUNK_SIZE), timeout)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _validator(headers):
+    """The validator to send back as If-Range: a strong ETag, else Last-Modified."""
+    etag = headers.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return headers.get('last-modified')
+
+
+def _content_range(headers):
+    """Return (first byte, total size) of a Content-Range header ('bytes 0-99/1000' or 'bytes */1000').
+
+    Either is None when missing or unknown ('*').
+    """
+    unit, _, value = headers.get('content-range', '').partition(' ')
+    if unit.lower() != 'bytes':
+        return None, None
+    byte_range, _, total = value.partition('/')
+    first = byte_range.partition('-')[0].strip()
+    return (int(first) if first.isdigit() else None), (int(total) if total.strip().isdigit() else None)
+
+
+def _keep_alive(headers):
+    return headers.get('connection', '').lower() != 'close' and (
+        'content-length' in headers or headers.get('transfer-encoding', '').lower() == 'chunked')
+
+
+class DownloadService:
+    def __init__(self, max_concurrency=4, max_connections_per_host=4, retries=3, backoff=0.5, timeout=60.0,
+                 deadline=None):
+        """timeout: seconds a connection may stay idle (connecting, or waiting for the next bytes)
+        deadline: optional limit in seconds on one whole transfer attempt, None for no limit
+        """
+        self.max_concurrency = max_concurrency
+        self.max_connections_per_host = max_connections_per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.deadline = deadline
+        self.metrics = TransferMetrics()
+
+    async def _request(self, pool, url, offset, validator=None):
+        """Open a GET on a pooled connection, following redirects; return (connection, status, headers).
+
+        With an offset, only the bytes from there on are asked for, and only if the file still matches `validator`.
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            scheme = parts.scheme or 'http'
+            port = parts.port or (443 if scheme == 'https' else 80)
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+
+            request = [f"GET {path} HTTP/1.1", f"Host: {parts.hostname}", "Connection: keep-alive",
+                       "Accept-Encoding: identity", "User-Agent: alis-helios"]
+            if offset:
+                request.append(f"Range: bytes={offset}-")
+                if validator:
+                    request.append(f"If-Range: {validator}")
+
+            connection = await pool.acquire(scheme, parts.hostname, port)
+            try:
+                connection.writer.write(('\r\n'.join(request) + '\r\n\r\n').encode('latin-1'))
+                await asyncio.wait_for(connection.writer.drain(), self.timeout)
+                status, headers = await _read_headers(connection.reader, self.timeout)
+            except BaseException:
+                pool.release(connection, reusable=False)
+                raise
+
+            if status in (301, 302, 303, 307, 308) and 'location' in headers:
+                async for _ in _iter_body(connection.reader, headers, self.timeout):
+                    pass
+                pool.release(connection, _keep_alive(headers))
+                url = urljoin(url, headers['location'])
+                continue
+            return connection, status, headers
+        raise DownloadError(f"Too many redirects for {url}")
+
+    async def _attempt(self, pool, job):
+        """One transfer attempt, resuming from the partial file. Returns (bytes, ttfb, reused)."""
+        offset = os.path.getsize(job.part_path) if os.path.exists(job.part_path) else 0
+        validator = job.read_validator() if offset else None
+        if offset and validator is None and not job.checksum:
+            # Nothing would tell whether the partial comes from the same version of the file
+            job.discard_partial()
+            offset = 0
+        hasher = job.hasher()
+        if hasher and offset:
+            with open(job.part_path, 'rb') as f:
+                for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    hasher.update(block)
+
+        start = time.perf_counter()
+        connection, status, headers = await self._request(pool, job.url, offset, validator)
+        ttfb = time.perf_counter() - start
+        reusable = False
+        received = 0
+        try:
+            if status == 416 and offset:
+                async for _ in _iter_body(connection.reader, headers, self.timeout):
+                    pass
+                reusable = _keep_alive(headers)
+                _, total = _content_range(headers)
+                if total == offset:
+                    # The partial file already holds everything
+                    return received, ttfb, connection.reused, hasher
+                job.discard_partial()
+                raise DownloadError(f"Partial file of {job.url} holds {offset} bytes but the remote file has "
+                                    f"{total if total is not None else 'an unknown size'}, starting over")
+            if status not in (200, 206):
+                async for _ in _iter_body(connection.reader, headers, self.timeout):
+                    pass
+                reusable = _keep_alive(headers)
+                raise HTTPStatusError(status, job.url)
+
+            if status == 206:
+                first, _ = _content_range(headers)
+                if first != offset:
+                    # Left unread, so the connection is closed rather than reused
+                    job.discard_partial()
+                    raise DownloadError(f"{job.url} answered the range from {offset} with bytes from {first}, "
+                                        f"starting over")
+                mode = 'ab'
+            else:
+                # A full body: the server ignored the Range request, or the file changed since the partial
+                mode = 'wb'
+                hasher = job.hasher()
+                job.write_validator(_validator(headers))
+            with open(job.part_path, mode) as f:
+                async for chunk in _iter_body(connection.reader, headers, self.timeout):
+                    f.write(chunk)
+                    if hasher:
+                        hasher.update(chunk)
+                    received += len(chunk)
+            reusable = _keep_alive(headers)
+            return received, ttfb, connection.reused, hasher
+        finally:
+            pool.release(connection, reusable)
+
+    async def fetch(self, pool, semaphore, job):
+        """Download one job with retries; returns the destination path, or None on failure."""
+        async with semaphore:
+            attempts = 0
+            total = 0
+            ttfb = None
+            error = None
+            while attempts <= self.retries:
+                attempts += 1
+                try:
+                    attempt = self._attempt(pool, job)
+                    if self.deadline is not None:
+                        attempt = asyncio.wait_for(attempt, self.deadline)
+                    received, ttfb, reused, hasher = await attempt
+                    total += received
+                    if hasher and hasher.hexdigest() != job.expected_digest():
+                        job.discard_partial()
+                        raise DownloadError(f"Checksum mismatch for {job.url}")
+                    os.replace(job.part_path, job.destination)
+                    job.write_validator(None)
+                    self.metrics.record(url=job.url, ok=True, bytes=total, ttfb=ttfb, attempts=attempts,
+                                        reused_connection=reused)
+                    return job.destination
+                except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, DownloadError) as e:
+                    error = e
+                    logging.warning(f"Download attempt {attempts} of {job.url} failed: {_describe(e)}")
+                    if isinstance(e, HTTPStatusError) and not e.retryable:
+                        break
+                    if attempts <= self.retries:
+                        await asyncio.sleep(self.backoff * 2 ** (attempts - 1))
+            logging.error(f"Giving up on {job.url}: {_describe(error)}")
+            self.metrics.record(url=job.url, ok=False, bytes=total, ttfb=ttfb, attempts=attempts,
+                                reused_connection=False)
+            return None
+
+    async def fetch_all(self, jobs):
+        pool = ConnectionPool(self.max_connections_per_host, self.metrics, self.timeout)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        for job in jobs:
+            directory = os.path.dirname(job.destination)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self.metrics.started = time.perf_counter()
+        try:
+            return await asyncio.gather(*(self.fetch(pool, semaphore, job) for job in jobs))
+        finally:
+            self.metrics.finished = time.perf_counter()
+            pool.close()
+
+    def download(self, jobs):
+        """Blocking entry point: download all jobs and return their paths (None for the failed ones)."""
+        jobs = list(jobs)
+        with span('download.batch', 'download', files=len(jobs)) as download_span:
+            paths = asyncio.run(self.fetch_all(jobs))
+            download_span.add_bytes(self.metrics.summary()['bytes'])
+        return paths
+
+
+class _LocalFileHandler(SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def send_head(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404, "File not found")
+            return None
+        stat = os.stat(path)
+        size = stat.st_size
+        etag = f'"{size:x}-{stat.st_mtime_ns:x}"'
+        last_modified = self.date_time_string(stat.st_mtime)
+        start, stop = 0, size
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        if if_range and if_range not in (etag, last_modified):
+            # The client's partial comes from another version of the file: send all of it
+            range_header = None
+        if range_header and range_header.startswith('bytes='):
+            first, _, last = range_header[len('bytes='):].partition('-')
+            start = int(first) if first else 0
+            stop = int(last) + 1 if last else size
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return None
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{stop - 1}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        self.send_header('Content-Length', str(stop - start))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        f = open(path, 'rb')
+        f.seek(start)
+        self._remaining = stop - start
+        return f
+
+    def copyfile(self, source, outputfile):
+        server = self.server
+        sent = 0
+        while self._remaining > 0:
+            block = source.read(min(CHUNK_SIZE, self._remaining))
+            if not block:
+                break
+            if server.should_fail(self.path, sent + len(block)):
+                # Cut the transfer half way to exercise the resume logic
+                outputfile.write(block[:len(block) // 2])
+                outputfile.flush()
+                self.close_connection = True
+                return
+            outputfile.write(block)
+            sent += len(block)
+            self._remaining -= len(block)
+
+
+class LocalFileServer:
+    """HTTP server for a local directory, run in a background thread; use as a context manager.
+
+    latency: seconds added before every response
+    fail_after_bytes: cut the first transfer of every file once it has sent this many bytes
+    """
+
+    def __init__(self, directory, host='127.0.0.1', port=0, latency=0.0, fail_after_bytes=None):
+        directory = os.path.abspath(directory)
+
+        class Handler(_LocalFileHandler):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, directory=directory, **kwargs)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.should_fail = self._should_fail
+        self.fail_after_bytes = fail_after_bytes
+        self._failed = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _should_fail(self, path, sent):
+        if self.fail_after_bytes is None or sent < self.fail_after_bytes:
+            return False
+        with self._lock:
+            if path in self._failed:
+                return False
+            self._failed.add(path)
+            return True
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def url(self, name):
+        return urljoin(self.base_url, name)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
@@ -1,11 +1,7 @@
 import logging
 from PyQt6.QtCore import QThread, pyqtSignal, QObject
-import pyspedas
-import pytplot
-from pytplot import tplot
 import os
-
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+from tracing import span
 
 class DownloadWorker(QObject):
     finished = pyqtSignal(list)
@@ -16,18 +12,26 @@ class DownloadWorker(QObject):
         self.date_end = date_end
 
     def run(self):
+        # pyspedas pulls in the whole scientific stack, so it is only imported once a download is requested.
+        import pyspedas
+
         try:
             logging.info(f"Starting download from {self.date_init} to {self.date_end}")
             trange = [self.date_init, self.date_end]
 
             # Example download calls
-            fgm_vars = pyspedas.themis.fgm(probe='a', trange=trange)
-            logging.debug(f"FGM Vars: {fgm_vars}")
-            esa_vars = pyspedas.themis.esa(probe='a', trange=trange)
-            logging.debug(f"ESA Vars: {esa_vars}")
-            erg_orb_vars = pyspedas.erg.orb(trange=trange)
-            pyspedas.omni.data(trange=trange)
-            gmag_vars = pyspedas.themis.gmag(sites=['fsmi', 'fykn', 'atha'], trange=trange)
+            with span('download.themis.fgm', 'download'):
+                fgm_vars = pyspedas.themis.fgm(probe='a', trange=trange)
+            logging.debug("FGM: %d variables loaded", len(fgm_vars or []))
+            with span('download.themis.esa', 'download'):
+                esa_vars = pyspedas.themis.esa(probe='a', trange=trange)
+            logging.debug("ESA: %d variables loaded", len(esa_vars or []))
+            with span('download.erg.orb', 'download'):
+                erg_orb_vars = pyspedas.erg.orb(trange=trange)
+            with span('download.omni', 'download'):
+                pyspedas.omni.data(trange=trange)
+            with span('download.themis.gmag', 'download'):
+                gmag_vars = pyspedas.themis.gmag(sites=['fsmi', 'fykn', 'atha'], trange=trange)
 
             variables_to_plot = ['tha_fgs_gse'] + ['tha_peef_en_eflux', 'tha_peef_velocity_dsl', 'tha_peif_en_eflux', 'tha_peif_velocity_dsl'] + \
                                 ['erg_orb_l2_pos_gse'] + ['proton_density', 'flow_speed', 'Pressure'] + gmag_vars + ['thg_mag_fsmi_subtract_median']
@@ -58,11 +62,14 @@ class LocalDataWorker(QObject):
         self.file_path = file_path
 
     def run(self):
+        import pytplot
+
         try:
             logging.info(f"Loading local data from {self.file_path}")
             file_extension = os.path.splitext(self.file_path)[1]
             if file_extension in ['.cdf', '.nc', '.h5', '.csv', '.txt']:
-                pytplot.cdf_to_tplot(self.file_path)
+                with span('decode.cdf_to_tplot', 'decode', nbytes=os.path.getsize(self.file_path)):
+                    pytplot.cdf_to_tplot(self.file_path)
                 variables_to_plot = pytplot.tplot_names()
                 self.finished.emit(variables_to_plot)
                 logging.info("Local data processing completed successfully.")
@@ -81,4 +88,68 @@ class LocalDataThread(QThread):
     def run(self):
         worker = LocalDataWorker(self.file_path)
         worker.finished.connect(self.finished)
-        worker.run()
\ No newline at end of file
+        worker.run()
+
+
+class BatchRenderWorker(QObject):
+    finished = pyqtSignal(list)
+
+    def __init__(self, jobs, max_workers=None, parent=None):
+        super().__init__(parent)
+        self.jobs = jobs
+        self.max_workers = max_workers
+
+    def run(self):
+        from batch_render import render_batch
+
+        try:
+            logging.info(f"Rendering {len(self.jobs)} plots")
+            saved = [path for path in render_batch(self.jobs, self.max_workers) if path is not None]
+            self.finished.emit(saved)
+        except Exception as e:
+            logging.error(f"An error occurred: {e}")
+
+class BatchRenderThread(QThread):
+    finished = pyqtSignal(list)
+
+    def __init__(self, jobs, max_workers=None, parent=None):
+        super().__init__(parent)
+        self.jobs = jobs
+        self.max_workers = max_workers
+
+    def run(self):
+        worker = BatchRenderWorker(self.jobs, self.max_workers)
+        worker.finished.connect(self.finished)
+        worker.run()
+
+
+class RangeAnalysisWorker(QObject):
+    finished = pyqtSignal(dict)
+
+    def __init__(self, range_analysis, date_init, date_end, parent=None):
+        super().__init__(parent)
+        self.range_analysis = range_analysis
+        self.date_init = date_init
+        self.date_end = date_end
+
+    def run(self):
+        try:
+            logging.info(f"Analysing {self.date_init} to {self.date_end}")
+            self.finished.emit(self.range_analysis.run(self.date_init, self.date_end))
+        except Exception as e:
+            logging.error(f"An error occurred: {e}")
+            self.finished.emit({})
+
+class RangeAnalysisThread(QThread):
+    finished = pyqtSignal(dict)
+
+    def __init__(self, range_analysis, date_init, date_end, parent=None):
+        super().__init__(parent)
+        self.range_analysis = range_analysis
+        self.date_init = date_init
+        self.date_end = date_end
+
+    def run(self):
+        worker = RangeAnalysisWorker(self.range_analysis, self.date_init, self.date_end)
+        worker.finished.connect(self.finished)
+        worker.run()
@@ -0,0 +1,240 @@
+"""
+Event detection over long time series (current sheets, reconnection candidates, boundary crossings).
+
+Every sample is compared with the mean of the window just before it and the window just after it, using cumulative
+sums so the rolling statistics cost O(n) whatever the window length:
+
+- B rotation: angle between the trailing and leading mean field vectors
+- Flow jet: deviation of the leading mean velocity from a longer centred background mean
+- Density jump: ratio between the leading and trailing mean densities
+
+Samples where enough criteria exceed their thresholds are grouped into time windows and ranked by score, where the
+score is the sum of each criterion divided by its threshold. Series can be fed in chunks (e.g. one day at a time)
+with `EventDetector.feed`, which keeps just enough of the previous chunk to make the result independent of where
+the chunks were cut.
+
+All inputs for one call must share the same int64 nanosecond epochs.
+"""
+import csv
+
+import numpy as np
+
+
+def _rolling_mean(values, start_offset, stop_offset):
+    """Mean of values[i + start_offset:i + stop_offset] for every i, clipped at the edges and ignoring NaNs.
+
+    Works on the first axis, so (n,) and (n, 3) inputs are handled in one pass.
+    """
+    n = values.shape[0]
+    valid = np.isfinite(values)
+    filled = np.where(valid, values, 0.0)
+
+    sums = np.zeros((n + 1,) + values.shape[1:])
+    np.cumsum(filled, axis=0, out=sums[1:])
+    counts = np.zeros((n + 1,) + values.shape[1:])
+    np.cumsum(valid, axis=0, out=counts[1:])
+
+    index = np.arange(n)
+    start = np.clip(index + start_offset, 0, n)
+    stop = np.clip(index + stop_offset, 0, n)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (sums[stop] - sums[start]) / (counts[stop] - counts[start])
+
+
+def _samples_for(seconds, epoch):
+    """Convert a duration into a number of samples using the median cadence of the epochs."""
+    steps = np.diff(epoch)
+    steps = steps[steps > 0]
+    if steps.size == 0:
+        return 1
+    return max(1, int(round(seconds * 1e9 / np.median(steps))))
+
+
+class EventDetector:
+    def __init__(self, window=60.0, background=600.0, rotation_threshold=30.0, jet_threshold=100.0,
+                 density_ratio_threshold=1.5, min_criteria=1, merge_gap=60.0, min_duration=0.0):
+        """
+        window: length (s) of the trailing/leading windows compared at each sample
+        background: length (s) of the centred window the flow-jet deviation is measured against
+        rotation_threshold: B rotation angle (degrees)
+        jet_threshold: velocity deviation (same units as the velocity, usually km/s)
+        density_ratio_threshold: leading/trailing density ratio (either direction)
+        min_criteria: how many criteria must exceed their threshold for a sample to be flagged
+        merge_gap: flagged windows closer than this (s) are merged into one event
+        min_duration: events shorter than this (s) are dropped
+        """
+        self.window = window
+        self.background = background
+        self.rotation_threshold = rotation_threshold
+        self.jet_threshold = jet_threshold
+        self.density_ratio_threshold = density_ratio_threshold
+        self.min_criteria = min_criteria
+        self.merge_gap = merge_gap
+        self.min_duration = min_duration
+
+        self.intervals = []
+        self._tail = None
+        self._tail_evaluated_from = 0
+
+    def compute_criteria(self, epoch, b=None, velocity=None, density=None):
+        """Return a dict with the rolling criterion of every available quantity, one value per sample."""
+        epoch = np.asarray(epoch, dtype=np.int64)
+        w = _samples_for(self.window, epoch)
+        criteria = {}
+
+        if b is not None:
+            b = np.asarray(b, dtype=float)[:, :3]
+            before = _rolling_mean(b, -w, 0)
+            after = _rolling_mean(b, 1, w + 1)
+            norm = np.linalg.norm(before, axis=1) * np.linalg.norm(after, axis=1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                cos_angle = np.einsum('ij,ij->i', before, after) / norm
+            criteria['rotation'] = np.degrees(np.arccos(np.clip(cos_angle, -1.0, 1.0)))
+
+        if velocity is not None:
+            velocity = np.asarray(velocity, dtype=float)[:, :3]
+            half = _samples_for(self.background, epoch) // 2
+            background = _rolling_mean(velocity, -half, half + 1)
+            after = _rolling_mean(velocity, 0, w)
+            criteria['jet'] = np.linalg.norm(after - background, axis=1)
+
+        if density is not None:
+            density = np.asarray(density, dtype=float)
+            before = _rolling_mean(density, -w, 0)
+            after = _rolling_mean(density, 1, w + 1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                ratio = after / before
+                criteria['density_ratio'] = np.where(ratio < 1, 1 / ratio, ratio)
+
+        return criteria
+
+    def _thresholds(self):
+        return {
+            'rotation': self.rotation_threshold,
+            'jet': self.jet_threshold,
+            'density_ratio': self.density_ratio_threshold,
+        }
+
+    def score(self, criteria):
+        """Return the per-sample score and the number of criteria exceeding their threshold."""
+        thresholds = self._thresholds()
+        score = None
+        exceeded = None
+        for name, values in criteria.items():
+            normalised = np.nan_to_num(values / thresholds[name], nan=0.0)
+            score = normalised if score is None else score + normalised
+            hits = (normalised >= 1).astype(np.int8)
+            exceeded = hits if exceeded is None else exceeded + hits
+        return score, exceeded
+
+    def _flagged_intervals(self, epoch, criteria, keep_from=0):
+        """Group flagged samples (from index keep_from on) into intervals with their peak values."""
+        score, exceeded = self.score(criteria)
+        flagged = exceeded >= self.min_criteria
+        flagged[:keep_from] = False
+        if not flagged.any():
+            return []
+
+        edges = np.diff(flagged.astype(np.int8), prepend=0, append=0)
+        starts = np.flatnonzero(edges == 1)
+        stops = np.flatnonzero(edges == -1)
+
+        intervals = []
+        for start, stop in zip(starts, stops):
+            peak = start + int(np.argmax(score[start:stop]))
+            interval = {
+                'start': int(epoch[start]),
+                'stop': int(epoch[stop - 1]),
+                'peak_time': int(epoch[peak]),
+                'score': float(score[peak]),
+            }
+            for name, values in criteria.items():
+                interval[name] = float(values[peak])
+            intervals.append(interval)
+        return intervals
+
+    def feed(self, epoch, b=None, velocity=None, density=None):
+        """Process the next chunk of a long series; chunks must be fed in time order."""
+        chunk = {'epoch': np.asarray(epoch, dtype=np.int64), 'b': b, 'velocity': velocity, 'density': density}
+        keep_from = 0
+        if self._tail is not None:
+            keep_from = self._tail_evaluated_from
+            for key, values in chunk.items():
+                if values is not None and self._tail[key] is not None:
+                    chunk[key] = np.concatenate([self._tail[key], np.asarray(values)])
+
+        criteria = self.compute_criteria(chunk['epoch'], chunk['b'], chunk['velocity'], chunk['density'])
+        # The last samples of this chunk lack their leading window, they are evaluated again with the next one
+        halo = _samples_for(max(self.window, self.background / 2), chunk['epoch']) + 1
+        n = len(chunk['epoch'])
+        evaluated = {name: values[:max(n - halo, keep_from)] for name, values in criteria.items()}
+        self.intervals.extend(self._flagged_intervals(chunk['epoch'], evaluated, keep_from))
+
+        # Keep the unevaluated samples plus one full context window before them
+        tail_start = max(n - 2 * halo, 0)
+        self._tail = {key: (None if values is None else np.asarray(values)[tail_start:])
+                      for key, values in chunk.items()}
+        self._tail_evaluated_from = max(n - halo, keep_from) - tail_start
+
+    def finish(self):
+        """Evaluate what is left of the last chunk and return the ranked catalogue."""
+        if self._tail is not None:
+            tail = self._tail
+            criteria = self.compute_criteria(tail['epoch'], tail['b'], tail['velocity'], tail['density'])
+            self.intervals.extend(self._flagged_intervals(tail['epoch'], criteria, self._tail_evaluated_from))
+            self._tail = None
+        return self.catalogue()
+
+    def detect(self, epoch, b=None, velocity=None, density=None):
+        """Detect the events of a series held in memory and return the ranked catalogue."""
+        self.intervals = []
+        self._tail = None
+        criteria = self.compute_criteria(epoch, b, velocity, density)
+        self.intervals = self._flagged_intervals(np.asarray(epoch, dtype=np.int64), criteria)
+        return self.catalogue()
+
+    def catalogue(self):
+        """Merge nearby intervals into events and rank them by peak score."""
+        merge_gap_ns = int(self.merge_gap * 1e9)
+        events = []
+        for interval in sorted(self.intervals, key=lambda interval: interval['start']):
+            if events and interval['start'] - events[-1]['stop'] <= merge_gap_ns:
+                last = events[-1]
+                last['stop'] = max(last['stop'], interval['stop'])
+                if interval['score'] > last['score']:
+                    last.update({key: value for key, value in interval.items() if key not in ('start', 'stop')})
+            else:
+                events.append(dict(interval))
+
+        min_duration_ns = int(self.min_duration * 1e9)
+        events = [event for event in events if event['stop'] - event['start'] >= min_duration_ns]
+        events.sort(key=lambda event: event['score'], reverse=True)
+        for rank, event in enumerate(events, start=1):
+            event['rank'] = rank
+        return events
+
+
+def boundary_crossings(epoch, inside):
+    """Return every transition of a boolean inside/outside series as (epoch, 'inbound' | 'outbound') pairs."""
+    inside = np.asarray(inside, dtype=bool)
+    changes = np.flatnonzero(np.diff(inside.astype(np.int8)))
+    epoch = np.asarray(epoch)
+    return [(epoch[index + 1], 'inbound' if inside[index + 1] else 'outbound') for index in changes]
+
+
+def save_catalogue(events, path):
+    """Write the event catalogue to CSV, with times as ISO strings."""
+    if not events:
+        open(path, 'w').close()
+        return
+    fieldnames = ['rank', 'start', 'stop', 'peak_time', 'score'] + \
+                 sorted({key for event in events for key in event} - {'rank', 'start', 'stop', 'peak_time', 'score'})
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        for event in events:
+            row = dict(event)
+            for key in ('start', 'stop', 'peak_time'):
+                row[key] = str(np.datetime64(row[key], 'ns'))
+            writer.writerow(row)
@@ -0,0 +1,253 @@
+"""
+Windowed feature extraction for machine learning.
+
+Each input file is cut into fixed time windows and every window becomes one row of features:
+
+- per component: mean, std, min, max
+- per component: mean and max absolute time derivative, from KineticCheckGradient
+- per component: PSD slope (Welch spectrum, log-log fit)
+- kinetic ordering: relative fluctuation delta B / B0 and the field variation time scale B0 / |dB/dt|
+
+Rows are written to a columnar store partitioned by source and day, one file per input holding one array per
+column, so a column can be read back for years of data without touching the others. Files are featurized in a
+process pool and a manifest records what has been done, so an interrupted run picks up where it stopped and new
+files are featurized incrementally.
+
+Usage:
+    pipeline = FeaturePipeline('features', source='MMS', window=300.0)
+    pipeline.run(FeaturePipeline.discover('data', '*fgm*.cdf'))
+    data_frame = FeatureStore('features').to_dataframe(source='MMS')
+"""
+import glob
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from timeseries import TimeSeries
+from tracing import span
+
+
+def _window_edges(epoch, window_ns):
+    """Return the start indices of consecutive fixed windows and their start times."""
+    first = epoch[0] - epoch[0] % window_ns
+    starts = np.arange(first, epoch[-1] + 1, window_ns, dtype=np.int64)
+    return np.searchsorted(epoch, starts), starts
+
+
+def _reduce(values, edges, n):
+    """Per-window count, sum, sum of squares, min and max of the columns of values, with reduceat."""
+    counts = np.diff(np.append(edges, n))
+    non_empty = counts > 0
+    idx = edges[non_empty]
+    sums = np.add.reduceat(values, idx, axis=0)
+    squares = np.add.reduceat(values ** 2, idx, axis=0)
+    minima = np.minimum.reduceat(values, idx, axis=0)
+    maxima = np.maximum.reduceat(values, idx, axis=0)
+    return counts[non_empty], non_empty, sums, squares, minima, maxima
+
+
+def _psd_slope(segment, fs):
+    """Slope of the log-log Welch spectrum of one window (NaN when the window is too short)."""
+    from scipy import signal
+
+    if segment.shape[0] < 16:
+        return np.full(segment.shape[1], np.nan)
+    f, pxx = signal.welch(segment, fs, axis=0, nperseg=min(256, segment.shape[0]))
+    valid = f > 0
+    log_f = np.log(f[valid])
+    with np.errstate(divide='ignore'):
+        log_p = np.log(pxx[valid])
+    slopes = np.full(segment.shape[1], np.nan)
+    for column in range(segment.shape[1]):
+        finite = np.isfinite(log_p[:, column])
+        if finite.sum() > 2:
+            slopes[column] = np.polyfit(log_f[finite], log_p[finite, column], 1)[0]
+    return slopes
+
+
+def extract_features(data, window=300.0):
+    """Compute the feature columns of every window of a TimeSeries (or a DataFrame with a datetime index)."""
+    from kinetics import KineticCheckGradient
+
+    series = data if isinstance(data, TimeSeries) else TimeSeries.from_dataframe(data)
+    epoch = series.epoch
+    values = series.values.astype(float)
+    names = [str(column).strip() for column in series.columns]
+    n = len(epoch)
+    if n == 0:
+        return {}
+
+    window_ns = int(window * 1e9)
+    edges, starts = _window_edges(epoch, window_ns)
+    counts, non_empty, sums, squares, minima, maxima = _reduce(values, edges, n)
+    means = sums / counts[:, None]
+    stds = np.sqrt(np.maximum(squares / counts[:, None] - means ** 2, 0))
+
+    # Gradients over the whole file so the windows do not get one-sided differences at their edges
+    kinetic_check = KineticCheckGradient(series)
+    kinetic_check.compute_gradients()
+    gradient_series = kinetic_check.get_gradients()
+    # Per ns gradients, put back on the samples (repeated timestamps share the value of their last sample)
+    gradients = np.full(values.shape, np.nan)
+    if len(gradient_series):
+        positions = np.searchsorted(gradient_series.epoch, epoch)
+        matched = positions < len(gradient_series)
+        matched[matched] = gradient_series.epoch[positions[matched]] == epoch[matched]
+        gradients[matched] = gradient_series.values[positions[matched]] * 1e9
+    abs_gradients = np.nan_to_num(np.abs(gradients))
+    gradient_counts, _, gradient_sums, _, _, gradient_max = _reduce(abs_gradients, edges, n)
+
+    steps = np.diff(epoch)
+    fs = 1e9 / np.median(steps[steps > 0]) if np.any(steps > 0) else 1.0
+    bounds = np.append(edges, n)
+    slopes = np.array([_psd_slope(values[bounds[i]:bounds[i + 1]], fs)
+                       for i in np.flatnonzero(non_empty)]).reshape(-1, len(names))
+
+    columns = {
+        'window_start': starts[non_empty],
+        'window_stop': starts[non_empty] + window_ns,
+        'samples': counts,
+    }
+    for i, name in enumerate(names):
+        columns[f'{name}_mean'] = means[:, i]
+        columns[f'{name}_std'] = stds[:, i]
+        columns[f'{name}_min'] = minima[:, i]
+        columns[f'{name}_max'] = maxima[:, i]
+        columns[f'{name}_grad_mean'] = gradient_sums[:, i] / gradient_counts
+        columns[f'{name}_grad_max'] = gradient_max[:, i]
+        columns[f'{name}_psd_slope'] = slopes[:, i]
+
+    # Kinetic ordering, from the vector components (the first three columns)
+    if values.shape[1] >= 3:
+        b0 = np.linalg.norm(means[:, :3], axis=1)
+        delta_b = np.sqrt(np.sum(stds[:, :3] ** 2, axis=1))
+        gradient_b = np.linalg.norm(gradient_sums[:, :3] / gradient_counts[:, None], axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            columns['delta_b_over_b0'] = delta_b / b0
+            columns['field_variation_time'] = b0 / gradient_b
+    return columns
+
+
+def _featurize_file(path, variable, window):
+    """Worker: load one CDF file and return its feature columns."""
+    return extract_features(TimeSeries.from_cdf(path, variable), window)
+
+
+class FeatureStore:
+    """Columnar store: <root>/source=<source>/date=<YYYY-MM-DD>/<name>.npz, one array per column."""
+
+    manifest_name = '_manifest.json'
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.manifest_path = os.path.join(root, self.manifest_name)
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def is_done(self, key, signature):
+        return self.manifest.get(key, {}).get('signature') == signature
+
+    def append(self, source, name, columns, key=None, signature=None):
+        """Write the columns of one input as a new partition file and record it in the manifest."""
+        if not columns or len(columns['window_start']) == 0:
+            partition_files = []
+        else:
+            day = str(np.datetime64(int(columns['window_start'][0]), 'ns').astype('datetime64[D]'))
+            directory = os.path.join(self.root, f'source={source}', f'date={day}')
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f'{name}.npz')
+            # Written under a temporary name so a crash never leaves a truncated partition behind
+            tmp_path = path + '.tmp.npz'
+            np.savez(tmp_path, **columns)
+            os.replace(tmp_path, path)
+            partition_files = [os.path.relpath(path, self.root)]
+        if key is not None:
+            self.manifest[key] = {'signature': signature, 'partitions': partition_files}
+            self._save_manifest()
+
+    def partitions(self, source=None, start=None, stop=None):
+        """List the partition files, optionally restricted to a source and a day range (YYYY-MM-DD)."""
+        pattern = os.path.join(self.root, f'source={source or "*"}', 'date=*', '*.npz')
+        selected = []
+        for path in sorted(glob.glob(pattern)):
+            day = os.path.basename(os.path.dirname(path))[len('date='):]
+            if (start is None or day >= start) and (stop is None or day <= stop):
+                selected.append(path)
+        return selected
+
+    def read(self, columns=None, source=None, start=None, stop=None):
+        """Read the requested columns (all when None) into a dict of concatenated arrays."""
+        parts = {}
+        for path in self.partitions(source, start, stop):
+            with np.load(path) as data:
+                for column in (columns or data.files):
+                    if column in data.files:
+                        parts.setdefault(column, []).append(data[column])
+        return {column: np.concatenate(arrays) for column, arrays in parts.items()}
+
+    def to_dataframe(self, columns=None, source=None, start=None, stop=None):
+        import pandas as pd
+
+        data = self.read(columns, source, start, stop)
+        data_frame = pd.DataFrame(data)
+        if 'window_start' in data_frame:
+            data_frame.index = pd.to_datetime(data_frame.pop('window_start'))
+        return data_frame
+
+
+class FeaturePipeline:
+    def __init__(self, store_root, source, variable='mms1_fgm_b_bcs_srvy_l2', window=300.0, max_workers=None):
+        self.store = FeatureStore(store_root)
+        self.source = source
+        self.variable = variable
+        self.window = window
+        self.max_workers = max_workers
+
+    @staticmethod
+    def discover(directory, pattern='*.cdf'):
+        """Find the input files under a directory, recursively."""
+        return sorted(glob.glob(os.path.join(directory, '**', pattern), recursive=True))
+
+    def _signature(self, path):
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns, self.variable, self.window]
+
+    def pending(self, paths):
+        """Return the files that have not been featurized yet, or have changed since."""
+        return [path for path in paths if not self.store.is_done(os.path.abspath(path), self._signature(path))]
+
+    def run(self, paths):
+        """Featurize the pending files in a process pool; results are written as each file completes."""
+        todo = self.pending(paths)
+        logging.info(f"Featurizing {len(todo)} of {len(paths)} files ({len(paths) - len(todo)} already done)")
+        if not todo:
+            return 0
+
+        done = 0
+        with span('compute.features', 'compute', files=len(todo)):
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {executor.submit(_featurize_file, path, self.variable, self.window): path for path in todo}
+                for future in as_completed(futures):
+                    path = futures[future]
+                    try:
+                        columns = future.result()
+                    except Exception as e:
+                        logging.error(f"Feature extraction failed for {path}: {e}")
+                        continue
+                    name = os.path.splitext(os.path.basename(path))[0]
+                    self.store.append(self.source, name, columns, key=os.path.abspath(path),
+                                      signature=self._signature(path))
+                    done += 1
+        return done
@@ -0,0 +1,169 @@
+"""
+Field-particle correlation (Klein & Howes 2016) over velocity-space distributions.
+
+For every velocity bin v and field component j the correlation is
+
+    C_Ej(v, t) = < -q v_j^2 / 2 * d(delta f)/dv_j * E_j >_tau
+
+where the average runs over a correlation window tau centred on t. The integrand is built for all velocity bins at
+once as one broadcast array operation, and the window average is taken with cumulative sums, so each output costs
+O(1) whatever the window length. Time is processed in blocks that overlap by one window, which bounds the memory
+to one block of the distribution however long the interval is.
+
+Distributions are given as f[t, v_1, ..., v_k] on a fixed velocity grid with one 1D axis per dimension, and the
+electric field as E[t, k] with column j matching velocity axis j. Units are taken as given: the result is in
+charge * velocity^2 * f / velocity * E units, e.g. SI throughout gives W/m^3 per unit phase-space volume.
+
+ESA energy spectra such as `tha_peif_en_eflux` can be turned into a 1D (speed) distribution with
+`eflux_to_phase_space_density` and `energy_to_speed`.
+"""
+import numpy as np
+
+ELEMENTARY_CHARGE = 1.602176634e-19  # C
+PROTON_MASS = 1.67262192e-27  # kg
+ELECTRON_MASS = 9.1093837e-31  # kg
+
+
+def energy_to_speed(energy_ev, mass=PROTON_MASS):
+    """Convert energies in eV into speeds in m/s."""
+    return np.sqrt(2 * np.asarray(energy_ev, dtype=float) * ELEMENTARY_CHARGE / mass)
+
+
+def eflux_to_phase_space_density(eflux, energy_ev, mass=PROTON_MASS):
+    """Convert differential energy flux in eV/(cm^2 s sr eV) into phase-space density in s^3/m^6.
+
+    eflux has time on the first axis and energy on the last, energy_ev is the matching energy grid (1D, or per time).
+    """
+    energy_joule = np.asarray(energy_ev, dtype=float) * ELEMENTARY_CHARGE
+    # eV/(cm^2 s sr eV) -> 1/(m^2 s sr)
+    eflux_si = np.asarray(eflux, dtype=float) * 1e4
+    return eflux_si * mass ** 2 / (2 * energy_joule ** 2)
+
+
+class FieldParticleCorrelation:
+    def __init__(self, velocity_axes, charge=ELEMENTARY_CHARGE, window=None, subtract_mean=True,
+                 max_block_bytes=256 * 2 ** 20):
+        """
+        velocity_axes: one 1D velocity grid per velocity dimension of the distribution
+        charge: particle charge (signed)
+        window: correlation window length in samples
+        subtract_mean: correlate the fluctuation delta f = f - <f> (the interval mean) instead of f
+        max_block_bytes: memory budget for the integrand of one block of times
+        """
+        self.velocity_axes = [np.asarray(axis, dtype=float) for axis in velocity_axes]
+        self.charge = charge
+        self.window = window
+        self.subtract_mean = subtract_mean
+        self.max_block_bytes = max_block_bytes
+
+    @property
+    def velocity_shape(self):
+        return tuple(len(axis) for axis in self.velocity_axes)
+
+    def _check(self, f, e_field):
+        if f.shape[1:] != self.velocity_shape:
+            raise ValueError(f"Distribution shape {f.shape[1:]} does not match the velocity grid {self.velocity_shape}")
+        if e_field.shape != (f.shape[0], len(self.velocity_axes)):
+            raise ValueError(f"Electric field must have shape {(f.shape[0], len(self.velocity_axes))}, "
+                             f"got {e_field.shape}")
+
+    def _rows_per_block(self, window):
+        """Number of output times per block that keeps the integrand within the memory budget."""
+        row_bytes = 8 * len(self.velocity_axes) * int(np.prod(self.velocity_shape))
+        return max(1, self.max_block_bytes // row_bytes - (window - 1))
+
+    def _mean_distribution(self, f):
+        """Time mean of the distribution, accumulated block by block so f need not be copied as float64."""
+        rows = self._rows_per_block(1)
+        total = np.zeros(self.velocity_shape)
+        for start in range(0, f.shape[0], rows):
+            total += np.nansum(f[start:start + rows], axis=0, dtype=float)
+        return total / f.shape[0]
+
+    def integrand(self, f, e_field, f_mean=None):
+        """Return -q v_j^2/2 d(delta f)/dv_j E_j for every time, component and velocity bin.
+
+        The result has shape (t, k, v_1, ..., v_k).
+        """
+        f = np.asarray(f, dtype=float)
+        if f_mean is not None:
+            f = f - f_mean
+        f = np.nan_to_num(f, nan=0.0)
+        dims = len(self.velocity_axes)
+
+        result = np.empty((f.shape[0], dims) + self.velocity_shape)
+        for j, axis in enumerate(self.velocity_axes):
+            # Reshape the velocity and field so they broadcast over all bins and times in one operation
+            shape = [1] * (dims + 1)
+            shape[j + 1] = len(axis)
+            v_j = axis.reshape(shape)
+            e_j = e_field[:, j].reshape((-1,) + (1,) * dims)
+            df_dv = np.gradient(f, axis, axis=j + 1) if len(axis) > 1 else np.zeros_like(f)
+            result[:, j] = -self.charge * 0.5 * v_j ** 2 * df_dv * e_j
+        return result
+
+    def iter_blocks(self, f, e_field, window=None, step=1):
+        """Yield (output_indices, correlation) blocks.
+
+        output_indices are the input indices of the window centres; correlation has shape
+        (len(output_indices), k, v_1, ..., v_k). With step > 1 only every step-th window is kept.
+        """
+        window = window or self.window
+        if not window:
+            raise ValueError("A correlation window (in samples) is required")
+        e_field = np.asarray(e_field, dtype=float)
+        if e_field.ndim == 1:
+            e_field = e_field[:, None]
+        self._check(f, e_field)
+
+        n_times = f.shape[0]
+        n_out = n_times - window + 1
+        if n_out <= 0:
+            return
+        f_mean = self._mean_distribution(f) if self.subtract_mean else None
+        rows = self._rows_per_block(window)
+
+        for out_start in range(0, n_out, rows):
+            out_stop = min(out_start + rows, n_out)
+            # The block needs window - 1 extra input samples beyond its last output
+            terms = self.integrand(f[out_start:out_stop + window - 1], e_field[out_start:out_stop + window - 1],
+                                   f_mean)
+            sums = np.cumsum(terms, axis=0)
+            averaged = np.empty((out_stop - out_start,) + terms.shape[1:])
+            averaged[0] = sums[window - 1]
+            averaged[1:] = sums[window:] - sums[:-window]
+            averaged /= window
+
+            indices = np.arange(out_start, out_stop)
+            keep = (indices % step) == 0
+            yield indices[keep] + window // 2, averaged[keep]
+
+    def compute(self, f, e_field, window=None, step=1):
+        """Return the window-centre indices and the correlation for the whole interval."""
+        indices = []
+        blocks = []
+        for block_indices, block in self.iter_blocks(f, e_field, window, step):
+            indices.append(block_indices)
+            blocks.append(block)
+        if not blocks:
+            return np.empty(0, dtype=int), np.empty((0, len(self.velocity_axes)) + self.velocity_shape)
+        return np.concatenate(indices), np.concatenate(blocks)
+
+    def energy_transfer_rate(self, correlation):
+        """Integrate the correlation over velocity space, giving the rate of energy transfer per component."""
+        result = correlation
+        # Integrate the last velocity dimension first so the axis numbers of the others do not move
+        for d in range(len(self.velocity_axes) - 1, -1, -1):
+            axis = self.velocity_axes[d]
+            values = np.moveaxis(result, 2 + d, -1)
+            if len(axis) > 1:
+                result = np.sum(0.5 * (values[..., 1:] + values[..., :-1]) * np.diff(axis), axis=-1)
+            else:
+                result = values[..., 0]
+        return result
+
+    def reduce_to_axis(self, correlation, axis):
+        """Sum the correlation over every velocity dimension except `axis`, e.g. to plot C(v_par, t)."""
+        dims = len(self.velocity_axes)
+        other = tuple(2 + d for d in range(dims) if d != axis)
+        return correlation.sum(axis=other) if other else correlation
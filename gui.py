@@ -2,16 +2,13 @@ import logging
 from PyQt6.QtCore import QThread, pyqtSignal, QTimer, Qt
 from PyQt6.QtGui import QPixmap
 from PyQt6.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QLabel, QLineEdit, QPushButton, QProgressBar, QDialog, QComboBox, QCheckBox, QFileDialog
-from downloader import DownloadThread, LocalDataThread
-import pytplot
+from downloader import BatchRenderThread, DownloadThread, LocalDataThread, RangeAnalysisThread
 from orbit import Orbit2D, Orbit3D
 import os
 from datetime import datetime
 import webbrowser
 from kinetics import CDFDataProcessor, KineticCheckGradient
-from power_spectral_density import PowerSpectralDensity
-
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+from tracing import span
 
 class WelcomeDialog(QDialog):
     def __init__(self, parent=None):
@@ -108,28 +105,29 @@ class KineticTestingDialog(QDialog):
         # Load the data (assuming you have the file path and it's accessible)
             cdf_file = 'data/mms1_fgm_srvy_l2_20240222_v5.440.0.cdf'  # Update with the actual file path
             data_processor = CDFDataProcessor(cdf_file)
-            data_frame = data_processor.get_data_frame()
+            series = data_processor.get_series()
 
         # Perform the kinetic calculation
-            kinetic_check = KineticCheckGradient(data_frame)
+            kinetic_check = KineticCheckGradient(series)
             kinetic_check.compute_gradients()
 
-        # Debug: print the gradient_df columns
-            print("Gradient DataFrame columns before plotting:", kinetic_check.gradient_df.columns)
+        # Debug: print the gradient columns
+            print("Gradient columns before plotting:", kinetic_check.get_gradients().columns)
 
         # Plot the result for the selected component
             kinetic_check.plot_gradient(column_name)
 
         elif selected_option == "PSD":
+            from power_spectral_analysis import PowerSpectralDensity
 
             # Load the data (assuming you have the file path and it's accessible)
             cdf_file = 'data/mms1_fgm_srvy_l2_20240222_v5.440.0.cdf'  # Update with the actual file path
             data_processor = CDFDataProcessor(cdf_file)
-            data_frame = data_processor.get_data_frame()
+            series = data_processor.get_series()
 
             # Perform the kinetic calculation
-            psd = PowerSpectralDensity(data_frame)
-            psd.load_cdf_to_dataframe()
+            psd = PowerSpectralDensity(series)
+            psd.plot_psd()
 
             # Debug: print the gradient_df columns
             print("Power Spectra Density plotted:")  # , kinetic_check.gradient_df.columns)
@@ -192,9 +190,15 @@ class PlotSelectionDialog(QDialog):
         self.display_button.clicked.connect(lambda: self.save_or_display_plot(save=False))
         layout.addWidget(self.display_button)
 
+        self.save_all_button = QPushButton("Save All Plots")
+        self.save_all_button.clicked.connect(self.save_all_plots)
+        layout.addWidget(self.save_all_button)
+
         self.setLayout(layout)
 
     def save_or_display_plot(self, save):
+        import pytplot
+
         selected_plot = self.plot_dropdown.currentText()
         if selected_plot in pytplot.tplot_names():
             if save:
@@ -208,7 +212,8 @@ class PlotSelectionDialog(QDialog):
                 os.mkdir(new_dir)
 
                 plot_path = os.path.join(new_dir, f"{selected_plot}.png")
-                pytplot.tplot(selected_plot, save_png=plot_path)
+                with span('render.tplot', 'render', variable=selected_plot):
+                    pytplot.tplot(selected_plot, save_png=plot_path)
                 logging.info(f"Plot saved as {plot_path}")
             else:
                 self.main_window.display_plot(selected_plot)
@@ -216,6 +221,36 @@ class PlotSelectionDialog(QDialog):
             logging.warning(f"Variable {selected_plot} not found in pytplot")
         self.accept()
 
+    def save_all_plots(self):
+        import numpy as np
+        import pytplot
+
+        today_date = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        new_dir = os.path.join("plots", f"plots_created_on_{today_date}")
+
+        jobs = []
+        for index in range(self.plot_dropdown.count()):
+            variable = self.plot_dropdown.itemText(index)
+            data = pytplot.get_data(variable)
+            # Spectrograms come with a third (energy/frequency) axis, they are left to pytplot
+            if data is None or len(data) != 2:
+                logging.info(f"Skipping {variable}: not a line plot")
+                continue
+            jobs.append({
+                'filename': os.path.join(new_dir, f"{variable}.png"),
+                'epoch': (np.asarray(data[0]) * 1e9).astype(np.int64),
+                'values': data[1],
+                'title': variable,
+            })
+
+        # Rendered off the GUI thread; the thread is kept on the main window so it outlives this dialog
+        render_thread = BatchRenderThread(jobs, parent=self.main_window)
+        render_thread.finished.connect(
+            lambda saved: logging.info(f"{len(saved)} plots saved in {new_dir}"))
+        render_thread.start()
+        self.main_window.render_thread = render_thread
+        self.accept()
+
 
 class OrbitPlotSelectionDialog(QDialog):
     plot_type_selected = pyqtSignal(str)
@@ -252,7 +287,9 @@ class MainWindow(QMainWindow):
 
         self.selected_mission = selected_mission  # Store the selected mission
         self.setWindowTitle(f"{selected_mission} Time Series Downloader")
-        self.setFixedSize(400, 300)
+        self.setFixedSize(400, 380)
+        # Kept for the whole session so a new date range only analyses the days not seen yet
+        self.range_analysis = None
 
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
@@ -284,6 +321,14 @@ class MainWindow(QMainWindow):
         self.plot_orbit_button.clicked.connect(self.plot_orbit)
         self.layout.addWidget(self.plot_orbit_button)
 
+        self.analyse_range_button = QPushButton("Analyse Date Range (MMS Only)")
+        self.analyse_range_button.clicked.connect(self.analyse_range)
+        self.layout.addWidget(self.analyse_range_button)
+
+        self.range_result_label = QLabel("")
+        self.range_result_label.setWordWrap(True)
+        self.layout.addWidget(self.range_result_label)
+
         self.info_label = QLabel("Further Information:")
         self.layout.addWidget(self.info_label)
 
@@ -377,11 +422,60 @@ class MainWindow(QMainWindow):
         self.download_button.setEnabled(False)
 
     def display_plot(self, plot_name):
+        import pytplot
+
         pytplot.tplot(plot_name)
         logging.info(f"Plot displayed: {plot_name}")
         self.plot_selection_dialog = PlotSelectionDialog(pytplot.tplot_names(), self, self)
         self.plot_selection_dialog.exec()
 
+    def analyse_range(self):
+        if self.selected_mission != "MMS":
+            logging.warning("Date range analysis is only available for MMS mission.")
+            return
+        date_init = self.date_init_input.text()
+        date_end = self.date_end_input.text()
+        if not date_init or not date_end:
+            logging.error("Both dates must be provided.")
+            return
+
+        if self.range_analysis is None:
+            from incremental import RangeAnalysis
+
+            # The downloaded CDF files, wherever pyspedas puts them, plus the local data folder
+            data_dirs = [os.environ.get('MMS_DATA_DIR', os.environ.get('SPEDAS_DATA_DIR', 'pydata')), 'data']
+            os.makedirs('data', exist_ok=True)
+            self.range_analysis = RangeAnalysis(os.path.join('data', 'catalogue.sqlite'), data_dirs)
+
+        self.analyse_range_button.setEnabled(False)
+        self.range_result_label.setText(f"Analysing {date_init} to {date_end}...")
+        self.range_analysis_thread = RangeAnalysisThread(self.range_analysis, date_init, date_end)
+        self.range_analysis_thread.finished.connect(self.on_range_analysis_finished)
+        self.range_analysis_thread.start()
+
+    def on_range_analysis_finished(self, result):
+        import numpy as np
+
+        self.analyse_range_button.setEnabled(True)
+        if not result:
+            self.range_result_label.setText("Date range analysis failed, see the log.")
+            return
+
+        epoch, _, gradient = result['gradients']
+        frequencies, pxx, slopes, _ = result['psd']
+        crossings = result['crossings']
+        new_days = max(result['computed'].values())
+        summary = [f"{result['chunks']} days, {new_days} newly computed, {len(epoch)} field samples"]
+        if len(slopes):
+            # The last FGM component is the field magnitude
+            summary.append(f"PSD slope |B|: {slopes[-1]:.2f}")
+        if len(gradient):
+            summary.append(f"max |dB/dt|: {np.nanmax(np.abs(gradient[:, :3])):.3g} nT/s")
+        summary.append(f"{len(crossings)} magnetopause crossings")
+        for crossing_time, direction in crossings:
+            logging.info(f"Magnetopause crossing ({direction}) at {np.datetime64(int(crossing_time), 'ns')}")
+        self.range_result_label.setText("; ".join(summary))
+
     def plot_orbit(self):
         if self.selected_mission == "MMS":
             date_init = self.date_init_input.text()
@@ -425,7 +519,7 @@ class MainWindow(QMainWindow):
             logging.error("Either select a date range or check the 'Use existing data' option with a file selected.")
             return
 
-        # orbit_plotter.save_plot()
+        orbit_plotter.plot()
         # logging.info("3D Orbit plot saved successfully.")
         # Connect the "Plot Orbit" button to the new plot_orbit method
         self.plot_orbit_button.clicked.connect(self.plot_orbit)
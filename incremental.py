@@ -0,0 +1,320 @@
+"""
+Incremental analysis over a time range that grows or moves.
+
+The time axis is cut into fixed chunks (one day by default) aligned on multiples of the chunk length, and every
+analysis stage keeps its state per chunk. Asking for a range only loads and computes the chunks that are not
+known yet and merges them with the cached ones, so widening the range by a day, or stepping to the adjacent
+interval, costs one chunk of work instead of a full recomputation:
+
+- IncrementalGradient: time derivatives per chunk; the samples next to a chunk boundary are recomputed at merge
+  time with their neighbours from the adjacent chunk, so the result equals np.gradient over the whole range
+- IncrementalWelch: per chunk the sum of the Welch segment periodograms and the segment count, computed on a
+  regular grid at one sampling frequency; merging adds the accumulators, so the PSD is the Welch average over
+  every segment of the range (segments do not straddle chunks)
+- IncrementalCrossings: magnetopause crossings per chunk plus the first and last inside flags, so the crossing
+  lists are concatenated and a crossing falling between two chunks is added at the junction
+
+Results always cover the whole chunks overlapping the requested range. A loader `loader(start_ns, stop_ns)`
+returns the int64 ns epochs and the values of [start_ns, stop_ns), or None when no data exists for that range;
+empty arrays mean data was expected but could not be read, and such chunks are not cached. `cdf_loader` builds a
+loader from the catalogue.
+
+    loader = cdf_loader(CDFCatalogue('data/catalogue.sqlite'), 'mms1_fgm_b_bcs_srvy_l2')
+    gradients = IncrementalGradient(loader)
+    epoch, values, gradient = gradients.result('2024-02-22', '2024-02-24')
+    epoch, values, gradient = gradients.result('2024-02-22', '2024-02-25')  # only loads 2024-02-24
+
+RangeAnalysis bundles the three stages over a catalogue of local data directories; the main window keeps one so
+changing its date range only analyses the days that were not seen yet.
+"""
+import logging
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from alignment import to_ns
+from events import boundary_crossings
+from tracing import span
+
+DAY_NS = 86400 * 10 ** 9
+
+
+def cdf_loader(catalogue, variable):
+    """Loader reading `variable` from the catalogued CDF files overlapping the requested range.
+
+    Only the latest version of every file is read, and the samples are returned sorted with one per epoch.
+    """
+    from timeseries import TimeSeries
+
+    def load(start_ns, stop_ns):
+        paths = catalogue.find(variable, start_ns, stop_ns - 1, latest=True)
+        if not paths:
+            return None
+        epochs, values = [], []
+        for path in paths:
+            series = TimeSeries.from_cdf(path, variable).slice_time(start_ns, stop_ns)
+            if len(series):
+                epochs.append(series.epoch)
+                values.append(series.values)
+        if not epochs:
+            logging.warning(f"{variable}: {len(paths)} catalogued files cover {np.datetime64(start_ns, 'ns')} "
+                            f"but none of their samples fall in it")
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        epoch, values = np.concatenate(epochs), np.concatenate(values)
+        # Files of different products can hold the same samples (e.g. the MEC epht89q and epht89d files both
+        # hold mms1_mec_r_gse): sort by time and keep one sample per epoch
+        epoch, first = np.unique(epoch, return_index=True)
+        return epoch, values[first]
+
+    return load
+
+
+class ChunkedStage:
+    """Analysis state kept per chunk; subclasses implement compute_chunk and merge.
+
+    At most `max_chunks` chunks are kept, the least recently used being dropped first.
+    """
+
+    name = 'chunked'
+
+    def __init__(self, loader, chunk=86400.0, max_chunks=None):
+        self.loader = loader
+        self.chunk_ns = int(chunk * 1e9)
+        self.max_chunks = max_chunks
+        self.chunks = OrderedDict()
+
+    def chunk_starts(self, start, stop):
+        """Start times of the chunks overlapping [start, stop)."""
+        start, stop = to_ns(start), to_ns(stop)
+        first = start - start % self.chunk_ns
+        return list(range(first, stop, self.chunk_ns))
+
+    def missing(self, start, stop):
+        return [chunk for chunk in self.chunk_starts(start, stop) if chunk not in self.chunks]
+
+    def update(self, start, stop):
+        """Compute the chunks of [start, stop) that are not cached yet; return how many were computed."""
+        todo = self.missing(start, stop)
+        for chunk in todo:
+            with span(f'compute.incremental.{self.name}', 'compute', chunk=str(np.datetime64(chunk, 'ns'))):
+                loaded = self.loader(chunk, chunk + self.chunk_ns)
+                if loaded is None:
+                    # No data exists for this chunk: remembered, so it is not asked for again
+                    self.chunks[chunk] = None
+                    continue
+                epoch, values = loaded
+                epoch = np.asarray(epoch, dtype=np.int64)
+                if len(epoch):
+                    self.chunks[chunk] = self.compute_chunk(epoch, np.asarray(values, dtype=float))
+                # Data was expected but none was read: not cached, the chunk is tried again on the next update
+        for chunk in self.chunk_starts(start, stop):
+            if chunk in self.chunks:
+                self.chunks.move_to_end(chunk)
+        if self.max_chunks is not None:
+            while len(self.chunks) > self.max_chunks:
+                self.chunks.popitem(last=False)
+        logging.debug("%s: %d chunks computed, %d cached", self.name, len(todo), len(self.chunks))
+        return len(todo)
+
+    def result(self, start, stop):
+        """Update the range and merge its chunks, in time order."""
+        self.update(start, stop)
+        states = [self.chunks.get(chunk) for chunk in self.chunk_starts(start, stop)]
+        return self.merge([state for state in states if state is not None])
+
+    def invalidate(self, start=None, stop=None):
+        """Forget the chunks of a range (all of them by default), e.g. after new data arrived."""
+        if start is None and stop is None:
+            self.chunks.clear()
+            return
+        for chunk in self.chunk_starts(start, stop):
+            self.chunks.pop(chunk, None)
+
+    def forget_empty(self):
+        """Forget the chunks cached as holding no data, e.g. after new files were downloaded."""
+        for chunk in [chunk for chunk, state in self.chunks.items() if state is None]:
+            del self.chunks[chunk]
+
+    def compute_chunk(self, epoch, values):
+        raise NotImplementedError
+
+    def merge(self, states):
+        raise NotImplementedError
+
+
+def _central_gradient(epoch, values, index):
+    """np.gradient's second-order interior formula at one sample, for unevenly spaced epochs."""
+    dx1 = float(epoch[index] - epoch[index - 1])
+    dx2 = float(epoch[index + 1] - epoch[index])
+    return (-dx2 / (dx1 * (dx1 + dx2)) * values[index - 1] + (dx2 - dx1) / (dx1 * dx2) * values[index] +
+            dx1 / (dx2 * (dx1 + dx2)) * values[index + 1])
+
+
+class IncrementalGradient(ChunkedStage):
+    """Time derivatives (per second) of every component, like KineticCheckGradient, computed per chunk."""
+
+    name = 'gradient'
+
+    def compute_chunk(self, epoch, values):
+        # Repeated timestamps keep their last sample, as in KineticCheckGradient
+        keep = np.append(np.diff(epoch) != 0, True)
+        epoch, values = epoch[keep], values[keep]
+        if len(epoch) < 2:
+            return epoch, values, np.full(values.shape, np.nan)
+        # Relative times keep the steps exact, int64 epochs would be rounded to 256 ns as float64
+        return epoch, values, np.gradient(values, epoch - epoch[0], axis=0) * 1e9
+
+    def merge(self, states):
+        if not states:
+            return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+        epoch = np.concatenate([state[0] for state in states])
+        values = np.concatenate([state[1] for state in states])
+        gradient = np.concatenate([state[2] for state in states])
+        n = len(epoch)
+        if n < 2:
+            return epoch, values, gradient
+
+        # Stitch the junctions: the samples on both sides of a boundary get their central difference
+        boundaries = np.cumsum([len(state[0]) for state in states])[:-1]
+        for index in np.unique(np.concatenate([boundaries - 1, boundaries])):
+            if 0 < index < n - 1:
+                gradient[index] = _central_gradient(epoch, values, index) * 1e9
+        # and the ends of the range get np.gradient's one-sided differences
+        gradient[0] = (values[1] - values[0]) / float(epoch[1] - epoch[0]) * 1e9
+        gradient[-1] = (values[-1] - values[-2]) / float(epoch[-1] - epoch[-2]) * 1e9
+        return epoch, values, gradient
+
+
+class IncrementalWelch(ChunkedStage):
+    """Welch PSD of every component, accumulated per chunk.
+
+    fs is estimated from the first chunk holding data when not given, and kept for the chunks that follow. Every
+    chunk is resampled onto a grid of 1 / fs steps (on multiples of the step, so all chunks share it) with
+    alignment.align before being segmented, so data recorded at another cadence, like the 8 and 16 S/s modes mixed
+    in MMS FGM survey files, still lands on the same frequency axis: the boxcar mean of every cell when the chunk
+    is sampled faster than fs, linear interpolation otherwise. Grid points in data gaps are NaN and the segments
+    holding them are dropped.
+    """
+
+    name = 'welch'
+
+    def __init__(self, loader, fs=None, nperseg=256, noverlap=None, window='hann', chunk=86400.0,
+                 max_chunks=None):
+        super().__init__(loader, chunk, max_chunks)
+        self.fs = fs
+        self.nperseg = nperseg
+        self.noverlap = nperseg // 2 if noverlap is None else noverlap
+        self.window = window
+
+    def compute_chunk(self, epoch, values):
+        from alignment import align
+        from coherence import _segment_spectra
+
+        steps = np.diff(epoch)
+        steps = steps[steps > 0]
+        if steps.size == 0:
+            return None
+        cadence = int(np.median(steps))
+        if self.fs is None:
+            self.fs = 1e9 / cadence
+        step = int(round(1e9 / self.fs))
+        grid = np.arange(epoch[0] + (-epoch[0]) % step, epoch[-1] + 1, step, dtype=np.int64)
+        if len(grid) < self.nperseg:
+            return None
+        if cadence < step:
+            values = align(epoch, values, grid, method='boxcar', width=step)
+        else:
+            values = align(epoch, values, grid, max_gap=2 * cadence)
+        series = values.reshape(len(values), -1).T
+        _, valid, spectra = _segment_spectra(series, self.fs, self.nperseg, self.noverlap, self.window)
+        return np.sum(np.abs(spectra) ** 2, axis=1), int(valid.sum())
+
+    def merge(self, states):
+        """Return the frequencies, the PSD (n_components, n_freq) and the slope and intercept of the log-log fits."""
+        frequencies = np.fft.rfftfreq(self.nperseg, 1 / self.fs) if self.fs else np.empty(0)
+        states = [state for state in states if state is not None]
+        segments = sum(count for _, count in states)
+        if segments == 0:
+            return frequencies, np.empty((0, len(frequencies))), np.empty(0), np.empty(0)
+        pxx = sum(power for power, _ in states) / segments
+
+        slopes = np.full(len(pxx), np.nan)
+        intercepts = np.full(len(pxx), np.nan)
+        for i, density in enumerate(pxx):
+            valid = (frequencies > 0) & (density > 0)
+            if valid.sum() > 2:
+                slopes[i], intercepts[i] = np.polyfit(np.log(frequencies[valid]), np.log(density[valid]), 1)
+        return frequencies, pxx, slopes, intercepts
+
+
+class IncrementalCrossings(ChunkedStage):
+    """Magnetopause crossings of the spacecraft positions (GSE, km) returned by the loader, per chunk."""
+
+    name = 'crossings'
+
+    def compute_chunk(self, epoch, positions):
+        from orbit import Orbit3D
+
+        radius = np.linalg.norm(positions, axis=1)
+        theta = np.arccos(positions[:, 2] / radius)
+        phi = np.arctan2(positions[:, 1], positions[:, 0])
+        inside = radius < Orbit3D.magnetopause_radius(theta, phi)
+        return (epoch[0], bool(inside[0])), (epoch[-1], bool(inside[-1])), boundary_crossings(epoch, inside)
+
+    def merge(self, states):
+        """Return every crossing of the range as (epoch, 'inbound' | 'outbound') pairs, in time order."""
+        crossings = []
+        previous = None
+        for first, last, chunk_crossings in states:
+            if previous is not None and previous[1] != first[1]:
+                crossings.append((first[0], 'inbound' if first[1] else 'outbound'))
+            crossings.extend(chunk_crossings)
+            previous = last
+        return crossings
+
+
+class RangeAnalysis:
+    """Gradient, PSD and magnetopause crossing stages over the CDF files under some data directories.
+
+    The stages live as long as this object, so calling run() again with a wider or shifted range only computes
+    the new chunks. The directories are rescanned on every run (only new or changed files are read) and chunks
+    previously found empty are retried when new files appeared. The catalogue is opened for the duration of a
+    run only, so runs may happen on different threads.
+    """
+
+    def __init__(self, database_path, data_directories, field_variable='mms1_fgm_b_bcs_srvy_l2',
+                 position_variable='mms1_mec_r_gse', chunk=86400.0, max_chunks=None):
+        self.database_path = database_path
+        self.data_directories = list(data_directories)
+        self.field_variable = field_variable
+        self.position_variable = position_variable
+        self.gradients = IncrementalGradient(None, chunk, max_chunks)
+        self.psd = IncrementalWelch(None, chunk=chunk, max_chunks=max_chunks)
+        self.crossings = IncrementalCrossings(None, chunk, max_chunks)
+
+    def run(self, start, stop):
+        """Return the gradients, PSD and crossings of [start, stop) and the number of chunks computed per stage."""
+        from catalogue import CDFCatalogue
+
+        with CDFCatalogue(self.database_path) as catalogue:
+            directories = [directory for directory in self.data_directories if os.path.isdir(directory)]
+            if directories and catalogue.scan(*directories):
+                for stage in (self.gradients, self.psd, self.crossings):
+                    stage.forget_empty()
+
+            field_loader = cdf_loader(catalogue, self.field_variable)
+            self.gradients.loader = field_loader
+            self.psd.loader = field_loader
+            self.crossings.loader = cdf_loader(catalogue, self.position_variable)
+
+            computed = {stage.name: len(stage.missing(start, stop))
+                        for stage in (self.gradients, self.psd, self.crossings)}
+            with span('compute.range_analysis', 'compute', start=str(start), stop=str(stop)):
+                return {
+                    'gradients': self.gradients.result(start, stop),
+                    'psd': self.psd.result(start, stop),
+                    'crossings': self.crossings.result(start, stop),
+                    'computed': computed,
+                    'chunks': len(self.gradients.chunk_starts(start, stop)),
+                }
@@ -1,32 +1,45 @@
-import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import spacepy.datamodel
+from timeseries import TimeSeries
+from tracing import span
 
 
 class CDFDataProcessor:
-    def __init__(self, cdf_file):
+    def __init__(self, cdf_file, variable='mms1_fgm_b_bcs_srvy_l2'):
         self.cdf_file = cdf_file
-        self.data_frame = self.load_cdf_to_dataframe()
+        self.variable = variable
+        self.series = self.load_cdf_to_series()
+        self._data_frame = None
+
+    def load_cdf_to_series(self):
+        """Load the variable of the CDF file into an array-backed TimeSeries."""
+        return TimeSeries.from_cdf(self.cdf_file, self.variable)
 
     def load_cdf_to_dataframe(self):
-        """Load the CDF file into a DataFrame."""
-        mms_dm_cdf = spacepy.datamodel.fromCDF(self.cdf_file)
-        mms_df = mms_dm_cdf.toDataFrame('mms1_fgm_b_bcs_srvy_l2')
-        mms_df.index = pd.to_datetime(mms_df.index)
+        """Convert the loaded series into a DataFrame."""
+        return self.series.to_dataframe()
+
+    @property
+    def data_frame(self):
+        # Built on first use only, the analysis classes work on the series
+        if self._data_frame is None:
+            self._data_frame = self.load_cdf_to_dataframe()
+        return self._data_frame
 
-        return mms_df
+    def get_series(self):
+        """Return the loaded TimeSeries."""
+        return self.series
 
     def get_data_frame(self):
-        """Return the loaded DataFrame."""
+        """Return the loaded data as a DataFrame."""
         return self.data_frame
 
 
 class KineticCheckGradient:
-    def __init__(self, data_frame):
-        self.data_frame = data_frame
-        self.gradient_df = pd.DataFrame()
-        # self.mms_df = CDFDataProcessor.mms_df
+    def __init__(self, data):
+        # A TimeSeries, or a DataFrame with a datetime index
+        self.series = data if isinstance(data, TimeSeries) else TimeSeries.from_dataframe(data)
+        self.gradients = None
+        self._gradient_df = None
 
     def filter_valid_time_intervals(self, time_numeric):
         """Identify and remove zero differences in time_numeric."""
@@ -38,42 +51,63 @@ class KineticCheckGradient:
             return valid_time_indices
         else:
             print("No valid time intervals")
-            return []
+            return valid_time_indices
 
     def compute_gradients(self):
-        """Compute the gradients for each magnetic field component."""
-        time_numeric = self.data_frame.index.astype(np.int64)  # // 10**9
-        valid_time_indices = self.filter_valid_time_intervals(time_numeric)
+        """Compute the gradients (per ns) for each magnetic field component."""
+        with span('compute.gradients', 'compute', samples=len(self.series)):
+            time_numeric = self.series.epoch
+            valid_time_indices = self.filter_valid_time_intervals(time_numeric)
 
-        if valid_time_indices.size > 0:
-            time_numeric_filtered = time_numeric[valid_time_indices]
+            if valid_time_indices.size > 0:
+                time_numeric_filtered = time_numeric[valid_time_indices]
+                # Times relative to the first sample keep the steps exact in float64
+                time_relative = time_numeric_filtered - time_numeric_filtered[0]
+                gradient = np.empty((len(self.series.components), len(valid_time_indices)))
+                # One component at a time bounds the temporaries of np.gradient to one row
+                for row, component in enumerate(self.series.components):
+                    gradient[row] = np.gradient(component[valid_time_indices].astype(float), time_relative)
+                self.gradients = TimeSeries(time_numeric_filtered, gradient, self.series.columns)
+            else:
+                self.gradients = TimeSeries(time_numeric, np.full(self.series.components.shape, np.nan),
+                                            self.series.columns)
+        self._gradient_df = None
 
-            for column in self.data_frame.columns:
-                data_filtered = self.data_frame[column].iloc[valid_time_indices].astype(float)
-                gradient = np.gradient(data_filtered, time_numeric_filtered)
-                self.gradient_df[column] = pd.Series(gradient, index=self.data_frame.index[valid_time_indices])
-        else:
-            self.gradient_df = pd.DataFrame(np.nan, index=self.data_frame.index, columns=self.data_frame.columns)
+    @property
+    def gradient_df(self):
+        if self._gradient_df is None:
+            import pandas as pd
+
+            self._gradient_df = self.gradients.to_dataframe() if self.gradients is not None else pd.DataFrame()
+        return self._gradient_df
 
     def plot_gradient(self, component):
         """Plot the gradients of the specified magnetic field component."""
-        plt.figure(figsize=(10, 6))
-        if component in self.gradient_df.columns:
-            plt.plot(self.data_frame.index, self.gradient_df[component], label=f'{component} Gradient', color='tab:red')
+        import matplotlib.pyplot as plt
+
+        fig = plt.figure(figsize=(10, 6))
+        if self.gradients is not None and component in self.gradients.columns:
+            plt.plot(self.gradients.times(), self.gradients[component], label=f'{component} Gradient', color='tab:red')
             plt.xlabel('Time')
             plt.ylabel(f'{component} Gradient (nT/s)')
             plt.title(f'{component} Gradient')
             plt.legend()
             plt.grid(True)
-            plt.savefig("kinetic_test.png")
+            with span('render.gradient', 'render', component=component):
+                plt.savefig("kinetic_test.png")
         else:
             print(f"Component {component} not found in gradient DataFrame")
+        plt.close(fig)
 
     def plot_all_gradients(self):
         """Plot the gradients for all magnetic field components."""
-        for component in self.data_frame.columns:
+        for component in self.series.columns:
             self.plot_gradient(component)
 
+    def get_gradients(self):
+        """Return the gradients as a TimeSeries."""
+        return self.gradients
+
     def get_gradient_df(self):
         """Return the gradient DataFrame."""
         return self.gradient_df
\ No newline at end of file
@@ -1,9 +1,12 @@
+import logging
 import sys
 from PyQt6.QtWidgets import QApplication, QDialog
 from gui import MainWindow, WelcomeDialog, MissionSelectionDialog
 
 
 def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
     app = QApplication(sys.argv)
 
     # Show the welcome dialog
@@ -1,16 +1,10 @@
-import matplotlib.pyplot as plt
-import plotly.express as px
-from pyspedas.mms.mms_orbit_plot import mms_orbit_plot
-from pytplot import get_data
-import pytplot
 import os
-import pyspedas
 import logging
 from datetime import datetime
-import spacepy.pycdf as cdf
-import pandas as pd
-import plotly.graph_objects as go
 import numpy as np
+from tracing import span
+from events import boundary_crossings
+from timeseries import TimeSeries
 
 
 class Orbit2D:
@@ -21,6 +15,8 @@ class Orbit2D:
         self.ysize = 8.0
         self.mms_state_vars = []
 
+        import matplotlib.pyplot as plt
+
         # The pyspedas.mms module contains a nice PNG of the earth that we can add to our orbit plots.
         from pyspedas.mms import __file__ as mmsinitfile
         mms_init_file_path = os.path.realpath(mmsinitfile)
@@ -29,9 +25,13 @@ class Orbit2D:
         self.im = plt.imread(self.png_path)
 
     def download_data(self):
+        import pyspedas
+        import pytplot
+
         if self.date_range is not None:
             logging.info(f"Downloading MMS data for date range: {self.date_range}")
-            pyspedas.mms.mec(trange=self.date_range, time_clip=True)
+            with span('download.mms.mec', 'download'):
+                pyspedas.mms.mec(trange=self.date_range, time_clip=True)
         elif self.local_file is not None:
             logging.info(f"Loading local file: {self.local_file}")
             pytplot.tplot(self.local_file)
@@ -41,10 +41,14 @@ class Orbit2D:
 
         # Get the MMS state variables
         self.mms_state_vars = [var for var in pytplot.tplot_names() if 'mms' in var and 'mec' in var]
-        for v in self.mms_state_vars:
-            pytplot.tkm2re(v, newname=v)
+        with span('convert.tkm2re', 'convert', variables=len(self.mms_state_vars)):
+            for v in self.mms_state_vars:
+                pytplot.tkm2re(v, newname=v)
 
     def plot(self):
+        import matplotlib.pyplot as plt
+        from pytplot import get_data
+
         self.download_data()
 
         # Create plots for XY, XZ, and YZ planes
@@ -70,6 +74,8 @@ class Orbit2D:
         plt.show()
 
     def create_plot(self, xlabel, ylabel):
+        import matplotlib.pyplot as plt
+
         fig, axis = plt.subplots(sharey=True, sharex=True, figsize=(self.xsize, self.ysize))
         axis.set_aspect('equal')
         axis.set_xlim([-60, 60])
@@ -80,6 +86,10 @@ class Orbit2D:
         return fig, axis
 
     def save_plot(self, directory='plots'):
+        import matplotlib.pyplot as plt
+        import pytplot
+        from pytplot import get_data
+
         if not os.path.exists(directory):
             os.mkdir(directory)
 
@@ -118,124 +128,148 @@ class Orbit2D:
         xyaxis.legend(loc='lower right')
 
         today_date = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        xyfig.savefig(os.path.join(directory, f"orbit_xy_{today_date}.png"))
-        xzfig.savefig(os.path.join(directory, f"orbit_xz_{today_date}.png"))
-        yzfig.savefig(os.path.join(directory, f"orbit_yz_{today_date}.png"))
+        with span('render.orbit2d', 'render'):
+            xyfig.savefig(os.path.join(directory, f"orbit_xy_{today_date}.png"))
+            xzfig.savefig(os.path.join(directory, f"orbit_xz_{today_date}.png"))
+            yzfig.savefig(os.path.join(directory, f"orbit_yz_{today_date}.png"))
         plt.close('all')
 
 
 class Orbit3D:
     """
 
-    Orbit2DSimple2 class is used for plotting the spacecraft orbital data.
+    Orbit3D class is used for plotting the spacecraft orbit together with a modelled 3D magnetopause.
 
     """
-    def __init__(self):
-        # Load the CDF file, should format always be mms1_mec_srvy_l2_epht89q_20240608 ?
-        cdf_file_path = 'trash/orbit_data/mms1_mec_srvy_l2_epht89q_20240608_v2.2.0.cdf'
-        cdf_file = cdf.CDF(cdf_file_path)
-
-        # Extract the relevant data
-        epoch = cdf_file['Epoch'][...]
-        r_gse = cdf_file['mms1_mec_r_gse'][...]
-
-        # Close the CDF file
-        cdf_file.close()
-
-        # Convert the data to a pandas DataFrame
-        data_dict = {
-            'Epoch': epoch,
-            'X_GSE': r_gse[:, 0],
-            'Y_GSE': r_gse[:, 1],
-            'Z_GSE': r_gse[:, 2]
-        }
-        df = pd.DataFrame(data_dict)
-
-        # Calculate the radial distance of the probe
-        df['Radial_Distance'] = np.sqrt(df['X_GSE'] ** 2 + df['Y_GSE'] ** 2 + df['Z_GSE'] ** 2)
-
-        # Define the magnetopause parameters
-        r_0 = 10.8 * 6371  # Scaling magnetopause to Earth's radius in kilometers
-        m = 0.1
-        beta_0 = -1.03
-        beta_1 = -0.07
-        beta_2 = -0.02
-        beta_3 = 0.09
-        c_n = -6
-        d_n = -10
-        e_n = 1
-        c_s = -7
-        d_s = -6
-        e_s = 1
-        theta_n = 0.64
-        phi_n = np.pi
-        theta_s = 1.25
-        phi_s = np.pi
-
-        # Create the theta and phi angles for the spacecraft positions
-        theta = np.arccos(df['Z_GSE'] / df['Radial_Distance'])
-        phi = np.arctan2(df['Y_GSE'], df['X_GSE'])
-
-        # Calculate psi_n and psi_s for the spacecraft positions
-        psi_n = np.arccos(np.cos(theta) * np.cos(theta_n) + np.sin(theta) * np.sin(theta_n) * np.cos(phi - phi_n))
-        psi_s = np.arccos(np.cos(theta) * np.cos(theta_s) + np.sin(theta) * np.sin(theta_s) * np.cos(phi - phi_s))
-
-        # Calculate Q for the spacecraft positions
-        Q = c_n * np.exp(d_n * psi_n ** e_n) + c_s * np.exp(d_s * psi_s ** e_s)
-
-        # Calculate beta for the spacecraft positions
-        beta = beta_0 + beta_1 * np.cos(phi) + beta_2 * np.sin(phi) + beta_3 * (np.sin(phi)) ** 2
+    # Magnetopause model parameters
+    r_0 = 10.8 * 6371  # Scaling magnetopause to Earth's radius in kilometers
+    m = 0.1
+    beta_0 = -1.03
+    beta_1 = -0.07
+    beta_2 = -0.02
+    beta_3 = 0.09
+    c_n = -6
+    d_n = -10
+    e_n = 1
+    c_s = -7
+    d_s = -6
+    e_s = 1
+    theta_n = 0.64
+    phi_n = np.pi
+    theta_s = 1.25
+    phi_s = np.pi
+
+    earth_radius = 6371  # Approximate radius of Earth in kilometers
+
+    def __init__(self, cdf_file_path='trash/orbit_data/mms1_mec_srvy_l2_epht89q_20240608_v2.2.0.cdf'):
+        # Should the file format always be mms1_mec_srvy_l2_epht89q_20240608 ?
+        self.cdf_file_path = cdf_file_path
+        self.positions = self.load_positions()
+        self.radial_distance = np.sqrt(self.positions['X_GSE'] ** 2 + self.positions['Y_GSE'] ** 2 +
+                                       self.positions['Z_GSE'] ** 2)
+        self.magnetopause_boundary = self.compute_magnetopause_boundary()
+        self._df = None
+
+    def load_positions(self):
+        """Load the spacecraft GSE position from the MEC CDF file."""
+        return TimeSeries.from_cdf(self.cdf_file_path, 'mms1_mec_r_gse', columns=['X_GSE', 'Y_GSE', 'Z_GSE'])
+
+    @property
+    def df(self):
+        """Positions and radial distance as a DataFrame with an Epoch column, built on first use."""
+        if self._df is None:
+            df = self.positions.to_dataframe().rename_axis('Epoch').reset_index()
+            df['Radial_Distance'] = self.radial_distance
+            self._df = df
+        return self._df
+
+    @classmethod
+    def magnetopause_radius(cls, theta, phi):
+        """Evaluate the magnetopause radius (km) for the given polar and azimuthal angles."""
+        # Calculate psi_n and psi_s
+        psi_n = np.arccos(np.cos(theta) * np.cos(cls.theta_n) +
+                          np.sin(theta) * np.sin(cls.theta_n) * np.cos(phi - cls.phi_n))
+        psi_s = np.arccos(np.cos(theta) * np.cos(cls.theta_s) +
+                          np.sin(theta) * np.sin(cls.theta_s) * np.cos(phi - cls.phi_s))
+
+        # Calculate Q
+        Q = cls.c_n * np.exp(cls.d_n * psi_n ** cls.e_n) + cls.c_s * np.exp(cls.d_s * psi_s ** cls.e_s)
+
+        # Calculate beta
+        beta = cls.beta_0 + cls.beta_1 * np.cos(phi) + cls.beta_2 * np.sin(phi) + cls.beta_3 * (np.sin(phi)) ** 2
 
         # Ensure beta is within a reasonable range
         beta = np.clip(beta, -2, 2)
 
-        # Calculate the magnetopause boundary for the spacecraft positions
-        magnetopause_boundary = r_0 * (np.cos(theta / 2) + m * np.sin(2 * theta) * (1 - np.exp(-theta))) ** beta + Q
+        return cls.r_0 * (np.cos(theta / 2) + cls.m * np.sin(2 * theta) * (1 - np.exp(-theta))) ** beta + Q
+
+    def compute_magnetopause_boundary(self):
+        """Evaluate the magnetopause boundary at the spacecraft positions."""
+        with span('compute.magnetopause', 'compute', samples=len(self.positions)):
+            # Create the theta and phi angles for the spacecraft positions
+            theta = np.arccos(self.positions['Z_GSE'] / self.radial_distance)
+            phi = np.arctan2(self.positions['Y_GSE'], self.positions['X_GSE'])
+
+            return self.magnetopause_radius(theta, phi)
 
-        # Identify the first crossing point
-        first_crossing_index = np.where(df['Radial_Distance'] < magnetopause_boundary)[0]
+    def first_crossing_time(self):
+        """Return the epoch of the first position inside the magnetopause, or None."""
+        first_crossing_index = np.where(self.radial_distance < self.magnetopause_boundary)[0]
         if first_crossing_index.size > 0:
-            first_crossing_index = first_crossing_index[0]
-            first_crossing_time = df.loc[first_crossing_index, 'Epoch']
+            return self.positions.times()[first_crossing_index[0]]
+        return None
+
+    def magnetopause_crossings(self):
+        """Return every magnetopause crossing along the orbit as (epoch, 'inbound' | 'outbound') pairs."""
+        inside = self.radial_distance < self.magnetopause_boundary
+        return boundary_crossings(self.positions.times(), inside)
+
+    @staticmethod
+    def create_sphere(radius=1, center=(0, 0, 0), resolution=50):
+        """Create the mesh of a sphere."""
+        u = np.linspace(0, 2 * np.pi, resolution)
+        v = np.linspace(0, np.pi, resolution)
+        x = radius * np.outer(np.cos(u), np.sin(v)) + center[0]
+        y = radius * np.outer(np.sin(u), np.sin(v)) + center[1]
+        z = radius * np.outer(np.ones(np.size(u)), np.cos(v)) + center[2]
+        return x, y, z
+
+    @staticmethod
+    def rotate_y(x, y, z, angle):
+        """Rotate the coordinates about the Y axis."""
+        cos_angle = np.cos(angle)
+        sin_angle = np.sin(angle)
+        x_rot = x * cos_angle + z * sin_angle
+        y_rot = y
+        z_rot = -x * sin_angle + z * cos_angle
+        return x_rot, y_rot, z_rot
+
+    def build_figure(self):
+        """Build the plotly figure with the orbit, the Earth and the magnetopause."""
+        import plotly.graph_objects as go
+
+        first_crossing_time = self.first_crossing_time()
+        if first_crossing_time is not None:
             print(f"First magnetopause crossing at: {first_crossing_time}")
 
         # Create the 3D scatter plot for the MMS orbit data
         scatter_plot = go.Scatter3d(
-            x=df['X_GSE'],
-            y=df['Y_GSE'],
-            z=df['Z_GSE'],
+            x=self.positions['X_GSE'],
+            y=self.positions['Y_GSE'],
+            z=self.positions['Z_GSE'],
             mode='markers',
-            marker=dict(size=2, color=df['Radial_Distance'] < magnetopause_boundary, colorscale='RdYlGn',
+            marker=dict(size=2, color=self.radial_distance < self.magnetopause_boundary, colorscale='RdYlGn',
                         colorbar=dict(title='Magnetopause Crossing')),
             name='MMS Orbit'
         )
 
-        # Create a 3D mesh for Earth
-        # Define a function to create a sphere
-        def create_sphere(radius=1, center=(0, 0, 0), resolution=50):
-            u = np.linspace(0, 2 * np.pi, resolution)
-            v = np.linspace(0, np.pi, resolution)
-            x = radius * np.outer(np.cos(u), np.sin(v)) + center[0]
-            y = radius * np.outer(np.sin(u), np.sin(v)) + center[1]
-            z = radius * np.outer(np.ones(np.size(u)), np.cos(v)) + center[2]
-            return x, y, z
-
         # Create Earth mesh
-        earth_radius = 6371  # Approximate radius of Earth in kilometers
         earth_center = (0, 0, 0)
-        x, y, z = create_sphere(radius=earth_radius, center=earth_center)
+        x, y, z = self.create_sphere(radius=self.earth_radius, center=earth_center)
 
         # Rotate the Earth mesh
-        def rotate_y(x, y, z, angle):
-            cos_angle = np.cos(angle)
-            sin_angle = np.sin(angle)
-            x_rot = x * cos_angle + z * sin_angle
-            y_rot = y
-            z_rot = -x * sin_angle + z * cos_angle
-            return x_rot, y_rot, z_rot
-
         angle = np.pi / 2  # 90 degrees in radians
-        x_rot, y_rot, z_rot = rotate_y(x, y, z, angle)
+        x_rot, y_rot, z_rot = self.rotate_y(x, y, z, angle)
 
         earth_mesh = go.Surface(
             x=x_rot, y=y_rot, z=z_rot,
@@ -249,35 +283,19 @@ class Orbit3D:
         phi_grid = np.linspace(0, 2 * np.pi, 100)
         theta_grid, phi_grid = np.meshgrid(theta_grid, phi_grid)
 
-        # Calculate psi_n and psi_s for the grid
-        psi_n_grid = np.arccos(
-            np.cos(theta_grid) * np.cos(theta_n) + np.sin(theta_grid) * np.sin(theta_n) * np.cos(phi_grid - phi_n))
-        psi_s_grid = np.arccos(
-            np.cos(theta_grid) * np.cos(theta_s) + np.sin(theta_grid) * np.sin(theta_s) * np.cos(phi_grid - phi_s))
-
-        # Calculate Q for the grid
-        Q_grid = c_n * np.exp(d_n * psi_n_grid ** e_n) + c_s * np.exp(d_s * psi_s_grid ** e_s)
-
-        # Calculate beta for the grid
-        beta_grid = beta_0 + beta_1 * np.cos(phi_grid) + beta_2 * np.sin(phi_grid) + beta_3 * (np.sin(phi_grid)) ** 2
-
-        # Ensure beta is within a reasonable range
-        beta_grid = np.clip(beta_grid, -2, 2)
-
         # Calculate the radial distance r for the grid
-        r_grid = r_0 * (np.cos(theta_grid / 2) + m * np.sin(2 * theta_grid) * (
-                    1 - np.exp(-theta_grid))) ** beta_grid + Q_grid
+        r_grid = self.magnetopause_radius(theta_grid, phi_grid)
 
         # Normalize r to avoid extremely large or small values
-        r_grid = np.clip(r_grid, -50 * earth_radius, 50 * earth_radius)
+        r_grid = np.clip(r_grid, -50 * self.earth_radius, 50 * self.earth_radius)
 
         x_magnetopause_grid = r_grid * np.sin(theta_grid) * np.cos(phi_grid)
         y_magnetopause_grid = r_grid * np.sin(theta_grid) * np.sin(phi_grid)
         z_magnetopause_grid = r_grid * np.cos(theta_grid)
 
         # Rotate the magnetopause grid
-        x_rot_grid, y_rot_grid, z_rot_grid = rotate_y(x_magnetopause_grid, y_magnetopause_grid, z_magnetopause_grid,
-                                                      angle)
+        x_rot_grid, y_rot_grid, z_rot_grid = self.rotate_y(x_magnetopause_grid, y_magnetopause_grid,
+                                                           z_magnetopause_grid, angle)
 
         # Create the magnetopause plot with reduced opacity
         magnetopause = go.Surface(x=x_rot_grid, y=y_rot_grid, z=z_rot_grid, colorscale='Viridis', opacity=0.5,
@@ -296,12 +314,20 @@ class Orbit3D:
             )
         )
 
+        return fig
+
+    def plot(self):
+        with span('render.orbit3d', 'render'):
+            fig = self.build_figure()
+
         # Show the plot
         fig.show()
 
 
 class Orbit2DSimple:
     def __init__(self):
+        from pyspedas.mms.mms_orbit_plot import mms_orbit_plot
+
         mms_orbit_plot(trange=['2015-10-16', '2015-10-17'],
                        probes=[3, 4],
                        data_rate='srvy',
@@ -1,50 +1,55 @@
-from scipy import signal
-import matplotlib.pyplot as plt
-from kinetics import CDFDataProcessor, KineticCheckGradient
 import numpy as np
+from timeseries import TimeSeries
+from tracing import span
 
 
-class PowerSpectralDensity(CDFDataProcessor):
+class PowerSpectralDensity:
 
     """
-    Computes the power spectral density
+    Computes the power spectral density of a magnetic field component
     """
 
-    def __init__(self):
-        cdf_file = 'data/mms1_fgm_srvy_l2_20240222_v5.440.0.cdf'
+    def __init__(self, data, fs=None):
+        # A TimeSeries, or a DataFrame with a datetime index
+        self.series = data if isinstance(data, TimeSeries) else TimeSeries.from_dataframe(data)
+        # Sampling frequency in Hz, estimated from the time index when not given
+        self.fs = fs if fs is not None else self.estimate_sampling_frequency()
 
-        super().__init__()
-        # self.data_frame = data_frame
-        self.cdf_file = cdf_file
-        self.data_frame = self.load_cdf_to_dataframe()
+    def estimate_sampling_frequency(self):
+        """Estimate the sampling frequency from the median spacing of the time index."""
+        return self.series.sampling_frequency()
 
-        cdf_file = 'data/mms1_fgm_srvy_l2_20240222_v5.440.0.cdf'
-        data_processor = CDFDataProcessor(cdf_file)
-        self.data_frame = data_processor.get_data_frame()
+    def compute_psd(self, component='Bt        '):
+        """Return the frequencies, the PSD and the slope and intercept of the log-log fit."""
+        from scipy import signal
 
-    def load_cdf_to_dataframe(self):
-        fs = 10e3
+        with span('compute.psd', 'compute', samples=len(self.series)):
+            f, pxx_den = signal.periodogram(np.asarray(self.series[component], dtype=float), self.fs)
 
-        f, pxx_den = signal.periodogram(self.data_frame['Bt        '], fs)
-        plt.semilogy(f, pxx_den)
-        plt.xlabel('frequency [Hz]')
-        plt.ylabel('PSD')
+            # Calculate the slope, excluding the first point to avoid log(0)
+            valid = (f > 0) & (pxx_den > 0)
+            slope, intercept = np.polyfit(np.log(f[valid]), np.log(pxx_den[valid]), 1)
 
-        return self.data_frame, plt.savefig('power_spectral_density.png')
+        return f, pxx_den, slope, intercept
 
-    def compute_psd(self):
-        fs = 10.0e5  # Sampling frequency
-        f, Pxx_den = signal.periodogram(self.data_frame['Bt        '], fs)
+    def plot_psd(self, component='Bt        ', filename='power_spectral_density.png'):
+        """Plot the PSD with its fitted slope and save it."""
+        import matplotlib.pyplot as plt
 
-        # Calculate the slope
-        log_f = np.log(f[1:])  # Exclude the first point to avoid log(0)
-        log_Pxx_den = np.log(Pxx_den[1:])
-        slope, intercept = np.polyfit(log_f, log_Pxx_den, 1)
+        f, pxx_den, slope, intercept = self.compute_psd(component)
 
-        # Plot the PSD
-        plt.semilogy(f, Pxx_den, label='PSD')
+        fig, axis = plt.subplots(figsize=(10, 6))
+        axis.semilogy(f, pxx_den, label='PSD')
 
         # Plot the slope line
         fit_line = np.exp(intercept) * f ** slope
-        plt.semilogy(f, fit_line, linestyle='--', label=f'Slope = {slope:.2f}')
+        axis.semilogy(f, fit_line, linestyle='--', label=f'Slope = {slope:.2f}')
+        axis.set_xlabel('frequency [Hz]')
+        axis.set_ylabel('PSD')
+        axis.legend()
 
+        with span('render.psd', 'render'):
+            fig.savefig(filename)
+        plt.close(fig)
+
+        return slope
@@ -0,0 +1,123 @@
+"""
+Array-backed time series.
+
+A TimeSeries holds int64 nanosecond epochs and one contiguous array per component (stored as a (k, n) block), plus
+the component names. Reading a CDF variable converts its epochs (TT2000, CDF_EPOCH or CDF_EPOCH16) with integer
+arithmetic and its data with one transposing copy, and slicing by position or time returns views, so the analysis
+paths (gradients, PSD, orbit) never go through pandas. A DataFrame is only built by `to_dataframe()`.
+
+    series = TimeSeries.from_cdf('mms1_fgm_srvy_l2_20240222_v5.cdf', 'mms1_fgm_b_bcs_srvy_l2')
+    bt = series['Bt        ']                                      # contiguous view of one component
+    window = series.slice_time('2024-02-22T10:00', '2024-02-22T11:00')  # view
+    data_frame = window.to_dataframe()
+"""
+import os
+
+import numpy as np
+
+from alignment import as_epoch, read_cdf_epoch, to_ns
+from tracing import span
+
+
+def _valid_range(variable, values):
+    """Replace the fill values and the values outside VALIDMIN/VALIDMAX by NaN, like spacepy's replace_invalid."""
+    attrs = variable.attrs
+    invalid = np.zeros(values.shape, dtype=bool)
+    if 'FILLVAL' in attrs:
+        invalid |= values == attrs['FILLVAL']
+    if 'VALIDMIN' in attrs:
+        invalid |= values < attrs['VALIDMIN']
+    if 'VALIDMAX' in attrs:
+        invalid |= values > attrs['VALIDMAX']
+    if invalid.any():
+        values[invalid] = np.nan
+    return values
+
+
+class TimeSeries:
+    def __init__(self, epoch, components, columns=None):
+        """epoch: (n,) int64 ns or datetime64; components: (k, n) array, one row per component (or (n,) for one)"""
+        self.epoch = as_epoch(epoch)
+        components = np.asarray(components)
+        self.components = components.reshape(1, -1) if components.ndim == 1 else components
+        if columns is None:
+            columns = [str(i) for i in range(len(self.components))]
+        self.columns = list(columns)
+
+    @classmethod
+    def from_values(cls, epoch, values, columns=None):
+        """Build from (n, k) row-per-sample values, copying them into contiguous components."""
+        values = np.asarray(values)
+        values = values.reshape(len(values), -1)
+        return cls(epoch, np.ascontiguousarray(values.T), columns)
+
+    @classmethod
+    def from_dataframe(cls, data_frame):
+        return cls.from_values(data_frame.index.to_numpy(), data_frame.to_numpy(), list(data_frame.columns))
+
+    @classmethod
+    def from_cdf(cls, path, variable, columns=None):
+        """Read one variable and its DEPEND_0 epochs from a CDF file."""
+        from spacepy import pycdf
+
+        with span('decode.cdf', 'decode', nbytes=os.path.getsize(path)):
+            with pycdf.CDF(path) as cdf_file:
+                data = cdf_file[variable]
+                epoch = read_cdf_epoch(cdf_file, str(data.attrs['DEPEND_0']))
+                values = data[...]
+                if columns is None and 'LABL_PTR_1' in data.attrs:
+                    columns = [str(label) for label in cdf_file[data.attrs['LABL_PTR_1']][...]]
+                if np.issubdtype(values.dtype, np.floating):
+                    values = _valid_range(data, values)
+        if columns is None:
+            columns = [variable] if values.ndim == 1 else [f'{variable}_{i}' for i in range(values.shape[1])]
+        with span('convert.timeseries', 'convert'):
+            return cls.from_values(epoch, values, columns)
+
+    def __len__(self):
+        return len(self.epoch)
+
+    @property
+    def nbytes(self):
+        return self.epoch.nbytes + self.components.nbytes
+
+    @property
+    def values(self):
+        """(n, k) view of the components, one row per sample."""
+        return self.components.T
+
+    def column_index(self, name):
+        return name if isinstance(name, (int, np.integer)) else self.columns.index(name)
+
+    def __getitem__(self, item):
+        """A component by name or position, or a TimeSeries view for a slice of samples."""
+        if isinstance(item, slice):
+            return TimeSeries(self.epoch[item], self.components[:, item], self.columns)
+        return self.components[self.column_index(item)]
+
+    def slice_time(self, start=None, stop=None):
+        """View of the samples in [start, stop); times in ns, datetime64 or ISO strings."""
+        first = 0 if start is None else np.searchsorted(self.epoch, to_ns(start))
+        last = len(self) if stop is None else np.searchsorted(self.epoch, to_ns(stop))
+        return self[first:last]
+
+    def select(self, columns):
+        return TimeSeries(self.epoch, self.components[[self.column_index(name) for name in columns]],
+                          [self.columns[self.column_index(name)] for name in columns])
+
+    def sampling_frequency(self):
+        """Sampling frequency in Hz from the median epoch step (1.0 when it cannot be told)."""
+        steps = np.diff(self.epoch)
+        steps = steps[steps > 0]
+        if steps.size == 0:
+            return 1.0
+        return 1e9 / np.median(steps)
+
+    def times(self):
+        return self.epoch.view('datetime64[ns]')
+
+    def to_dataframe(self):
+        import pandas as pd
+
+        with span('convert.dataframe', 'convert', samples=len(self)):
+            return pd.DataFrame(self.values, index=pd.DatetimeIndex(self.times()), columns=self.columns)
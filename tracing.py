@@ -0,0 +1,246 @@
+"""
+Span-style timing of the pipeline stages (download, decode, convert, compute, render).
+
+Tracing is off by default and then `span()` hands back a shared no-op context manager, so instrumented code pays a
+single attribute check. It can be switched on from code with `enable()` or from the environment:
+
+    ALIS_TRACE=trace.json python main.py             # plain JSON list of spans
+    ALIS_TRACE=trace.trace.json python main.py       # Chrome trace, open it in chrome://tracing or Perfetto
+    ALIS_TRACE_MEMORY=1                              # also record the peak memory of every span (tracemalloc)
+
+Each span records its wall time, an optional byte count and, when memory tracing is on, the peak memory allocated
+above the level at which the span started. tracemalloc has a single process-wide peak, so memory is traced in one
+thread at a time: the first thread opening a span owns the counter until its outermost span closes, and spans
+opened meanwhile in other threads (download, analysis or render workers) get no peak_bytes rather than a wrong
+one. Allocations made by other threads during an owned span still count towards its peak.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+
+
+class _NullSpan:
+    """Stand-in returned while tracing is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def add_bytes(self, nbytes):
+        pass
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    def __init__(self, tracer, name, category, nbytes, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.nbytes = nbytes
+        self.attrs = attrs
+        self.thread_id = threading.get_ident()
+        self.start_ns = 0
+        self.duration_ns = 0
+        self.peak_bytes = None
+        self._traces_memory = False
+        self._memory_start = 0
+        self._memory_peak = 0
+
+    def add_bytes(self, nbytes):
+        """Add to the number of bytes handled by this stage."""
+        self.nbytes = (self.nbytes or 0) + int(nbytes)
+
+    def set(self, **attrs):
+        """Attach extra attributes to the span."""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.tracer._push(self)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration_ns = time.perf_counter_ns() - self.start_ns
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.tracer._pop(self)
+        return False
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'category': self.category,
+            'start_ns': self.start_ns - self.tracer.origin_ns,
+            'duration_ns': self.duration_ns,
+            'bytes': self.nbytes,
+            'peak_bytes': self.peak_bytes,
+            'thread_id': self.thread_id,
+            'attrs': self.attrs,
+        }
+
+
+class Tracer:
+    def __init__(self, enabled=False, trace_memory=False):
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.origin_ns = time.perf_counter_ns()
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Thread whose spans use the tracemalloc peak, and how many of its memory spans are open
+        self._memory_thread = None
+        self._memory_depth = 0
+
+    def span(self, name, category='compute', nbytes=None, **attrs):
+        """Return a context manager timing the enclosed block."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, category, nbytes, attrs)
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _claim_memory(self, span):
+        """Give the span the memory counter unless a span of another thread holds it."""
+        with self._lock:
+            if self._memory_thread not in (None, span.thread_id):
+                return False
+            self._memory_thread = span.thread_id
+            self._memory_depth += 1
+            return True
+
+    def _release_memory(self):
+        with self._lock:
+            self._memory_depth -= 1
+            if self._memory_depth == 0:
+                self._memory_thread = None
+
+    def _push(self, span):
+        stack = self._stack()
+        if self.trace_memory and self._claim_memory(span):
+            span._traces_memory = True
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            current, peak = tracemalloc.get_traced_memory()
+            # The enclosing span keeps the peak seen so far before the counter is reset for the new one
+            if stack:
+                stack[-1]._memory_peak = max(stack[-1]._memory_peak, peak)
+            tracemalloc.reset_peak()
+            span._memory_start = current
+            span._memory_peak = current
+        stack.append(span)
+
+    def _pop(self, span):
+        stack = self._stack()
+        if stack and stack[-1] is span:
+            stack.pop()
+        if span._traces_memory:
+            if tracemalloc.is_tracing():
+                peak = max(span._memory_peak, tracemalloc.get_traced_memory()[1])
+                span.peak_bytes = peak - span._memory_start
+                if stack:
+                    stack[-1]._memory_peak = max(stack[-1]._memory_peak, peak)
+            self._release_memory()
+        with self._lock:
+            self.spans.append(span)
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+
+    def records(self):
+        """Return the finished spans as dictionaries, in start order."""
+        with self._lock:
+            spans = list(self.spans)
+        return [span.to_dict() for span in sorted(spans, key=lambda span: span.start_ns)]
+
+    def summary(self):
+        """Aggregate the spans per name: count, total wall time, bytes and the largest peak memory."""
+        totals = {}
+        for record in self.records():
+            total = totals.setdefault(record['name'], {'count': 0, 'seconds': 0.0, 'bytes': 0, 'peak_bytes': None})
+            total['count'] += 1
+            total['seconds'] += record['duration_ns'] / 1e9
+            total['bytes'] += record['bytes'] or 0
+            if record['peak_bytes'] is not None:
+                total['peak_bytes'] = max(total['peak_bytes'] or 0, record['peak_bytes'])
+        return totals
+
+    def export_json(self, path):
+        with open(path, 'w') as f:
+            json.dump({'spans': self.records(), 'summary': self.summary()}, f, indent=2, default=str)
+
+    def export_chrome_trace(self, path):
+        """Write the spans in the Chrome trace event format (complete events, microseconds)."""
+        pid = os.getpid()
+        events = []
+        for record in self.records():
+            args = dict(record['attrs'])
+            if record['bytes'] is not None:
+                args['bytes'] = record['bytes']
+            if record['peak_bytes'] is not None:
+                args['peak_bytes'] = record['peak_bytes']
+            events.append({
+                'name': record['name'],
+                'cat': record['category'],
+                'ph': 'X',
+                'ts': record['start_ns'] / 1e3,
+                'dur': record['duration_ns'] / 1e3,
+                'pid': pid,
+                'tid': record['thread_id'],
+                'args': args,
+            })
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=str)
+
+    def export(self, path):
+        """Export to Chrome-trace format when the file name ends in .trace.json, to plain JSON otherwise."""
+        if path.endswith('.trace.json'):
+            self.export_chrome_trace(path)
+        else:
+            self.export_json(path)
+        logging.info(f"Trace with {len(self.spans)} spans written to {path}")
+
+
+tracer = Tracer()
+
+
+def span(name, category='compute', nbytes=None, **attrs):
+    """Time a block with the global tracer, e.g. `with span('decode.cdf', 'decode', nbytes=size): ...`."""
+    if not tracer.enabled:
+        return _NULL_SPAN
+    return Span(tracer, name, category, nbytes, attrs)
+
+
+def enable(trace_memory=False):
+    tracer.enabled = True
+    tracer.trace_memory = trace_memory
+
+
+def disable():
+    tracer.enabled = False
+
+
+def _configure_from_environment():
+    path = os.environ.get('ALIS_TRACE')
+    if not path:
+        return
+    enable(trace_memory=os.environ.get('ALIS_TRACE_MEMORY', '') not in ('', '0'))
+    atexit.register(tracer.export, path)
+
+
+_configure_from_environment()